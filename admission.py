@@ -0,0 +1,124 @@
+import os
+import math
+import time
+import threading
+from contextlib import contextmanager
+
+# Requests allowed to wait beyond those the Whisper limit lets run at once
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "8"))
+
+# Memory that admitted requests may reserve in total (bytes); defaults to half of RAM
+ADMISSION_MEMORY_BUDGET = int(os.getenv("ADMISSION_MEMORY_BUDGET", "0"))
+
+# Estimated peak memory of one request: a fixed part plus a part per second of audio
+# (the decoded samples, features and intermediate results)
+ADMISSION_BASE_BYTES = int(os.getenv("ADMISSION_BASE_BYTES", str(64 * 1024 ** 2)))
+ADMISSION_BYTES_PER_SECOND = int(os.getenv("ADMISSION_BYTES_PER_SECOND", str(512 * 1024)))
+
+# Bounds on the Retry-After value sent with a 429
+MIN_RETRY_AFTER = 1
+MAX_RETRY_AFTER = 300
+
+
+class Overloaded(Exception):
+    def __init__(self, reason, retry_after):
+        super().__init__(f"Server is busy ({reason}); retry in {retry_after} s")
+        self.retry_after = retry_after
+
+
+def _physical_memory():
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        return 0
+
+
+# Decides up front whether a request can be served, so overload is answered with a
+# fast 429 instead of slowing down everyone already admitted. A request is admitted
+# while there is room in the bounded queue and its estimated memory fits the budget;
+# inside the pipeline each model is then limited to its own number of concurrent users.
+class AdmissionController:
+    def __init__(self, limits, queue_size=ADMISSION_QUEUE_SIZE, memory_budget=ADMISSION_MEMORY_BUDGET,
+                 base_bytes=ADMISSION_BASE_BYTES, bytes_per_second=ADMISSION_BYTES_PER_SECOND):
+        self.limits = dict(limits)
+        self.capacity = self.limits.get("whisper", 1) + queue_size
+        self.memory_budget = memory_budget or _physical_memory() // 2
+        self.base_bytes = base_bytes
+        self.bytes_per_second = bytes_per_second
+        self._lock = threading.Lock()
+        self._admitted = 0
+        self._reserved = 0
+        self._waiting = {name: 0 for name in self.limits}
+        self._semaphores = {name: threading.BoundedSemaphore(limit) for name, limit in self.limits.items()}
+        # Moving average of how long an admitted request takes, for Retry-After
+        self._service_seconds = 30.0
+
+    def estimate_bytes(self, duration):
+        return self.base_bytes + int(duration * self.bytes_per_second)
+
+    # Cheap check made before an upload is read, so a full server rejects it at once
+    def check(self):
+        with self._lock:
+            if self._admitted >= self.capacity:
+                raise Overloaded("queue full", self._retry_after())
+
+    # Reserve room for a request of the given audio duration; the reservation is
+    # released when the context exits. Raises Overloaded when there is no room. A request
+    # larger than the whole budget is still admitted when nothing else is running.
+    # Sessions whose length the client decides (live streams) pass timed=False so they
+    # do not skew the Retry-After estimate.
+    @contextmanager
+    def admit(self, duration, timed=True):
+        needed = self.estimate_bytes(duration)
+        with self._lock:
+            if self._admitted >= self.capacity:
+                raise Overloaded("queue full", self._retry_after())
+            if self._admitted and self._reserved + needed > self.memory_budget:
+                raise Overloaded("memory budget exhausted", self._retry_after())
+            self._admitted += 1
+            self._reserved += needed
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - start
+            with self._lock:
+                self._admitted -= 1
+                self._reserved -= needed
+                if timed:
+                    self._service_seconds = 0.8 * self._service_seconds + 0.2 * elapsed
+
+    # Hold one of a model's concurrency slots; admitted requests wait here in turn
+    @contextmanager
+    def resource(self, name):
+        semaphore = self._semaphores.get(name)
+        if semaphore is None:
+            yield
+            return
+        with self._lock:
+            self._waiting[name] += 1
+        try:
+            semaphore.acquire()
+        finally:
+            with self._lock:
+                self._waiting[name] -= 1
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+    def status(self):
+        with self._lock:
+            return {
+                "admitted": self._admitted,
+                "capacity": self.capacity,
+                "reserved_bytes": self._reserved,
+                "memory_budget": self.memory_budget,
+                "waiting": dict(self._waiting),
+            }
+
+    # Roughly when a slot frees up: the queue ahead drains at the Whisper concurrency
+    def _retry_after(self):
+        ahead = max(1, self._admitted - self.limits.get("whisper", 1) + 1)
+        seconds = self._service_seconds * ahead / max(1, self.limits.get("whisper", 1))
+        return max(MIN_RETRY_AFTER, min(MAX_RETRY_AFTER, math.ceil(seconds)))
@@ -0,0 +1,75 @@
+import heapq
+
+
+# Function to assign transcription text to diarization segments in one sweep over both
+# lists sorted by time. A transcription segment that spans several speaker turns has its
+# words split between them in proportion to the time it overlaps each one; a segment
+# overlapping no turn goes to the nearest one. Runs in O((D + T) log(D + T)) plus the
+# number of overlapping pairs. Returns one list of text pieces per diarization segment,
+# in the order the diarization segments were given.
+def align_segments(diarization, transcription_segments):
+    pieces = [[] for _ in diarization]
+    if not diarization:
+        return pieces
+
+    turns = sorted(range(len(diarization)), key=lambda i: diarization[i]['start'])
+    ordered = sorted(transcription_segments, key=lambda s: (s['start'], s['end']))
+
+    active = []  # heap of (end, turn index) for turns that started before the current segment ends
+    next_turn = 0
+    last_closed = None  # most recently finished turn, for segments that fall in a gap
+    for segment in ordered:
+        start, end = segment['start'], segment['end']
+        while next_turn < len(turns) and diarization[turns[next_turn]]['start'] < end:
+            index = turns[next_turn]
+            heapq.heappush(active, (diarization[index]['end'], index))
+            next_turn += 1
+        # Turns that ended before this segment starts cannot overlap any later segment either
+        while active and active[0][0] <= start:
+            last_closed = heapq.heappop(active)[1]
+
+        overlaps = []
+        for turn_end, index in active:
+            turn_start = diarization[index]['start']
+            if end > start:
+                overlap = min(end, turn_end) - max(start, turn_start)
+            else:
+                # Zero-length segment: it belongs to the turns containing its instant
+                overlap = 1.0 if turn_start <= start < turn_end else 0.0
+            if overlap > 0:
+                overlaps.append((turn_start, index, overlap))
+
+        if overlaps:
+            overlaps.sort()
+            _split_words(segment['text'], overlaps, pieces)
+        else:
+            index = _nearest_turn(diarization, turns, next_turn, last_closed, start, end)
+            if segment['text'].strip():
+                pieces[index].append(segment['text'].strip())
+    return pieces
+
+
+# Function to divide a segment's words between turns proportionally to overlap duration
+def _split_words(text, overlaps, pieces):
+    words = text.split()
+    total = sum(overlap for _, _, overlap in overlaps)
+    taken = 0
+    covered = 0.0
+    for _, index, overlap in overlaps:
+        covered += overlap
+        upto = round(len(words) * covered / total)
+        if upto > taken:
+            pieces[index].append(' '.join(words[taken:upto]))
+            taken = upto
+
+
+# Function to pick the turn closest in time to a segment that overlaps none
+def _nearest_turn(diarization, turns, next_turn, last_closed, start, end):
+    candidates = []
+    if last_closed is not None:
+        candidates.append((start - diarization[last_closed]['end'], last_closed))
+    if next_turn < len(turns):
+        candidates.append((diarization[turns[next_turn]]['start'] - end, turns[next_turn]))
+    if not candidates:
+        return turns[-1]
+    return min(candidates)[1]
@@ -0,0 +1,217 @@
+import os
+import sys
+import threading
+import numpy as np
+import database
+from database import DB_PATH
+
+# IVF index file, kept next to speakers.db
+ANN_INDEX_PATH = os.getenv("ANN_INDEX_PATH", os.path.splitext(DB_PATH)[0] + ".ivf.npz")
+
+# Inverted lists probed per query: higher means better recall and slower queries
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "8"))
+
+# Number of inverted lists; 0 picks roughly sqrt(number of speakers)
+ANN_NLIST = int(os.getenv("ANN_NLIST", "0"))
+
+KMEANS_ITERATIONS = 10
+# k-means is trained on at most this many points per list
+TRAINING_POINTS_PER_LIST = 256
+# Rows processed at once when assigning vectors to lists
+ASSIGN_BLOCK = 65536
+
+
+# Inverted-file index over L2-normalized speaker embeddings. Vectors are stored grouped by
+# list (CSR layout) so probing a list reads one contiguous slice. Rows inserted after the
+# last build go to a small delta that is scanned exhaustively until the next rebuild.
+class IVFIndex:
+    def __init__(self, centroids, offsets, vectors, ids, names):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.vectors = vectors
+        self.ids = ids
+        self.names = names
+        # Delta rows live in buffers that grow geometrically, so n inserts cost O(n)
+        self._delta_vectors = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+        self._delta_ids = np.zeros(0, dtype=np.int64)
+        self._delta_size = 0
+        self.delta_names = []
+        self.max_id = int(ids.max()) if len(ids) else 0
+
+    @property
+    def delta_vectors(self):
+        return self._delta_vectors[:self._delta_size]
+
+    @property
+    def delta_ids(self):
+        return self._delta_ids[:self._delta_size]
+
+    def __len__(self):
+        return len(self.ids) + self._delta_size
+
+    @classmethod
+    def build(cls, ids, names, vectors, nlist=ANN_NLIST, seed=0):
+        vectors = _normalize(np.asarray(vectors, dtype=np.float32))
+        ids = np.asarray(ids, dtype=np.int64)
+        nlist = nlist or max(1, int(np.sqrt(len(vectors))))
+        nlist = max(1, min(nlist, len(vectors)))
+
+        centroids = _train_centroids(vectors, nlist, np.random.default_rng(seed))
+        assignments = _assign(vectors, centroids)
+        order = np.argsort(assignments, kind="stable")
+        counts = np.bincount(assignments, minlength=nlist)
+        offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        return cls(centroids, offsets, vectors[order], ids[order], [names[i] for i in order])
+
+    # Rows at or below max_id are already indexed, e.g. read by a refresh that ran after
+    # the insert committed, and are skipped
+    def add(self, row_id, name, vector):
+        if row_id <= self.max_id:
+            return
+        vector = _normalize(np.asarray(vector, dtype=np.float32).reshape(1, -1))
+        if self._delta_size == len(self._delta_ids):
+            capacity = max(16, 2 * len(self._delta_ids))
+            vectors = np.zeros((capacity, self._delta_vectors.shape[1]), dtype=np.float32)
+            vectors[:self._delta_size] = self.delta_vectors
+            ids = np.zeros(capacity, dtype=np.int64)
+            ids[:self._delta_size] = self.delta_ids
+            self._delta_vectors, self._delta_ids = vectors, ids
+        self._delta_vectors[self._delta_size] = vector[0]
+        self._delta_ids[self._delta_size] = row_id
+        self.delta_names.append(name)
+        self._delta_size += 1
+        self.max_id = row_id
+
+    # Return the k best (name, cosine similarity) matches for each query embedding
+    def search(self, queries, k=1, nprobe=ANN_NPROBE):
+        queries = _normalize(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        nprobe = max(1, min(nprobe, len(self.centroids)))
+        probed = np.argsort(-(queries @ self.centroids.T), axis=1)[:, :nprobe]
+        # Rows added while this search runs are ignored rather than half-read
+        size = self._delta_size
+        delta_scores = queries @ self._delta_vectors[:size].T
+        delta_names = self.delta_names[:size]
+
+        results = []
+        for query, lists, extra in zip(queries, probed, delta_scores):
+            rows = np.concatenate([np.arange(self.offsets[l], self.offsets[l + 1]) for l in lists])
+            scores = np.concatenate((self.vectors[rows] @ query, extra))
+            names = [self.names[row] for row in rows] + delta_names
+            top = np.argsort(-scores)[:k]
+            results.append([(names[i], float(scores[i])) for i in top])
+        return results
+
+    # Write to a temporary file and rename it over the old index so readers never see a partial file
+    def save(self, path=ANN_INDEX_PATH):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f, centroids=self.centroids, offsets=self.offsets, vectors=self.vectors,
+                ids=self.ids, names=np.array(self.names, dtype=object),
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=ANN_INDEX_PATH):
+        with np.load(path, allow_pickle=True) as data:
+            return cls(data["centroids"], data["offsets"], data["vectors"], data["ids"], list(data["names"]))
+
+
+# Process-wide handle on the persisted index. It follows the database: rows enrolled since
+# the last build are picked up on load and on insert, and an offline rebuild is swapped
+# in as soon as the new file appears.
+class AnnIndex:
+    def __init__(self, db_path=DB_PATH, path=ANN_INDEX_PATH):
+        self.db_path = db_path
+        self.path = path
+        self._lock = threading.Lock()
+        self._index = None
+        self._mtime = None
+
+    def search(self, queries, k=1, nprobe=ANN_NPROBE):
+        with self._lock:
+            self._refresh()
+            index = self._index
+        if index is None or not len(index):
+            return [[] for _ in np.atleast_2d(queries)]
+        return index.search(queries, k, nprobe)
+
+    def add(self, row_id, name, embedding):
+        with self._lock:
+            if self._index is not None:
+                self._index.add(row_id, name, embedding.numpy())
+
+    # Build a fresh index from the database and atomically replace the file on disk
+    def rebuild(self, nlist=ANN_NLIST):
+        ids, names, vectors = _read_speakers(self.db_path)
+        if not len(ids):
+            return None
+        index = IVFIndex.build(ids, names, vectors, nlist)
+        index.save(self.path)
+        with self._lock:
+            self._index = None
+            self._refresh()
+        return index
+
+    def _refresh(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if self._index is not None and mtime == self._mtime:
+            return
+        index = IVFIndex.load(self.path)
+        # Catch up with speakers enrolled after the file was built
+        for row_id, name, vector in zip(*_read_speakers(self.db_path, after_id=index.max_id)):
+            index.add(row_id, name, vector)
+        self._index, self._mtime = index, mtime
+
+
+def _read_speakers(db_path, after_id=0):
+    rows = database.read_speaker_embeddings(db_path, after_id)
+    return [row[0] for row in rows], [row[1] for row in rows], [row[2].numpy() for row in rows]
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+# Spherical k-means on a sample of the vectors
+def _train_centroids(vectors, nlist, rng):
+    sample_size = min(len(vectors), nlist * TRAINING_POINTS_PER_LIST)
+    sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        assignments = _assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        empty = np.bincount(assignments, minlength=nlist) == 0
+        # Re-seed empty lists from random points instead of leaving them dead
+        sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+        centroids = _normalize(sums)
+    return centroids
+
+
+def _assign(vectors, centroids):
+    return np.concatenate([
+        np.argmax(vectors[i:i + ASSIGN_BLOCK] @ centroids.T, axis=1)
+        for i in range(0, len(vectors), ASSIGN_BLOCK)
+    ])
+
+
+ann_index = AnnIndex()
+database.register_index(ann_index)
+
+
+if __name__ == '__main__':
+    # Offline rebuild: python ann_index.py rebuild [nlist]
+    if len(sys.argv) >= 2 and sys.argv[1] == "rebuild":
+        nlist = int(sys.argv[2]) if len(sys.argv) > 2 else ANN_NLIST
+        index = ann_index.rebuild(nlist)
+        if index is None:
+            print("No speakers enrolled; nothing to index")
+        else:
+            print(f"Indexed {len(index)} speakers in {len(index.centroids)} lists -> {ann_index.path}")
+    else:
+        print("usage: python ann_index.py rebuild [nlist]")
@@ -1,40 +1,62 @@
-from flask import Flask, request, render_template_string
-from transcribe import transcribe_audio
+from flask import Flask, Response, request, render_template_string
+from transcribe import transcribe_audio, admission
+from admission import Overloaded
+from audio import probe_duration
+from uploads import UPLOAD_FOLDER, MAX_UPLOAD_BYTES, UploadTooLarge, upload_path, save_stream
+from database import init_db
+import metrics
+from metrics import stage_timer, in_flight, server_timing
 import os
-import sqlite3
 
 app = Flask(__name__)
 
-UPLOAD_FOLDER = './uploads'
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+# Werkzeug rejects larger bodies with a 413 while it is still reading them
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES or None
 
 # Ensure the upload folder exists
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 
 # Create a database to store speaker embeddings if it doesn't exist
-def init_db():
-    conn = sqlite3.connect('speakers.db')
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS speakers
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, embedding BLOB)''')
-    conn.commit()
-    conn.close()
-
 init_db()
 
 @app.route('/', methods=['GET', 'POST'])
 def upload_file():
     if request.method == 'POST':
+        # Reject before the multipart body is parsed when the queue is already full
+        try:
+            admission.check()
+        except Overloaded as e:
+            return str(e), 429, {"Retry-After": str(e.retry_after)}
         file = request.files.get('file')
         if file:
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-            file.save(file_path)
-            transcription = transcribe_audio(file_path)
-            return render_template_string(HTML_TEMPLATE, transcription=transcription)
+            with in_flight("flask"):
+                timings = {}
+                file_path = upload_path(file.filename, app.config['UPLOAD_FOLDER'])
+                try:
+                    with stage_timer("upload", timings):
+                        save_stream(file.stream, file_path)
+                except UploadTooLarge as e:
+                    return str(e), 413
+                try:
+                    metrics.UPLOAD_BYTES.observe(os.path.getsize(file_path), "flask")
+                    with admission.admit(probe_duration(file_path)):
+                        transcription = transcribe_audio(file_path, timings)
+                except Overloaded as e:
+                    return str(e), 429, {"Retry-After": str(e.retry_after)}
+                finally:
+                    os.remove(file_path)
+                with stage_timer("render", timings):
+                    page = render_template_string(HTML_TEMPLATE, transcription=transcription)
+            return page, 200, {"Server-Timing": server_timing(timings)}
 
     return render_template_string(HTML_TEMPLATE)
 
+@app.route('/metrics')
+def get_metrics():
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
 HTML_TEMPLATE = '''
 <!doctype html>
 <html lang="en">
@@ -0,0 +1,202 @@
+import os
+import tempfile
+import subprocess
+from multiprocessing import shared_memory
+import numpy as np
+import torch
+
+# Every model in the pipeline works on 16 kHz mono audio
+SAMPLE_RATE = 16000
+
+# Samples read from the decoder per block (one second by default)
+DECODE_BLOCK_SAMPLES = int(os.getenv("DECODE_BLOCK_SAMPLES", str(SAMPLE_RATE)))
+
+# Recordings at least this long are decoded to a memory-mapped file rather than held
+# in shared memory, so resident memory stays bounded however long the upload is
+DECODE_MMAP_SECONDS = float(os.getenv("DECODE_MMAP_SECONDS", "600"))
+
+# Where memory-mapped recordings are written; keep it on disk rather than tmpfs
+DECODE_MMAP_DIR = os.getenv("DECODE_MMAP_DIR", "./uploads")
+
+
+# Decoded 16 kHz mono float32 audio held in shared memory. Pickling only sends
+# the segment name, so worker processes attach to the same buffer instead of
+# receiving a copy of the samples.
+class SharedAudio:
+    def __init__(self, shm, num_samples, owner):
+        self._shm = shm
+        self.num_samples = num_samples
+        self.owner = owner
+        self.array = np.ndarray((num_samples,), dtype=np.float32, buffer=shm.buf)
+
+    @classmethod
+    def create(cls, num_samples):
+        shm = shared_memory.SharedMemory(create=True, size=max(1, num_samples) * 4)
+        return cls(shm, num_samples, owner=True)
+
+    @classmethod
+    def attach(cls, name, num_samples):
+        return cls(shared_memory.SharedMemory(name=name), num_samples, owner=False)
+
+    def __reduce__(self):
+        return (SharedAudio.attach, (self._shm.name, self.num_samples))
+
+    # Zero-copy torch view of the samples
+    @property
+    def tensor(self):
+        return torch.from_numpy(self.array)
+
+    @property
+    def duration(self):
+        return self.num_samples / SAMPLE_RATE
+
+    def close(self):
+        self.array = None
+        self._shm.close()
+        if self.owner:
+            self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Decoded audio backed by a file of float32 samples and memory-mapped, so its pages
+# can be dropped and re-read by the kernel instead of staying resident. Pickling sends
+# the path; workers map the same file.
+class MappedAudio(SharedAudio):
+    def __init__(self, path, num_samples, owner):
+        self.path = path
+        self.num_samples = num_samples
+        self.owner = owner
+        if num_samples:
+            # Copy-on-write: readers never modify the file, and torch gets a writable array
+            self.array = np.memmap(path, dtype=np.float32, mode="c", shape=(num_samples,))
+        else:
+            self.array = np.zeros(0, dtype=np.float32)
+
+    @classmethod
+    def attach(cls, path, num_samples):
+        return cls(path, num_samples, owner=False)
+
+    def __reduce__(self):
+        return (MappedAudio.attach, (self.path, self.num_samples))
+
+    def close(self):
+        self.array = None
+        if self.owner:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+
+# Function to read an audio file's duration from its container without decoding it.
+# Returns 0.0 when it cannot be determined.
+def probe_duration(file_path):
+    cmd = [
+        "ffprobe", "-v", "error", "-show_entries", "format=duration",
+        "-of", "default=noprint_wrappers=1:nokey=1", file_path,
+    ]
+    try:
+        return float(subprocess.run(cmd, capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, ValueError, subprocess.CalledProcessError):
+        return 0.0
+
+
+# Generator over fixed-size blocks of s16le PCM read from an ffmpeg pipe, which
+# resamples and downmixes as it decodes. The same buffer is reused for every block,
+# so each yielded int16 view is only valid until the next one is requested.
+def _pcm_blocks(file_path, block_samples, sample_rate):
+    cmd = [
+        "ffmpeg", "-nostdin", "-loglevel", "error", "-threads", "0", "-i", file_path,
+        "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(sample_rate), "-",
+    ]
+    buffer = bytearray(block_samples * 2)
+    view = memoryview(buffer)
+    # stderr goes to a file so a chatty ffmpeg can never block on a full pipe
+    with tempfile.TemporaryFile() as errors:
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=errors)
+        finished = False
+        try:
+            while True:
+                filled = 0
+                while filled < len(buffer):
+                    read = process.stdout.readinto(view[filled:])
+                    if not read:
+                        break
+                    filled += read
+                filled -= filled % 2
+                if filled:
+                    yield np.frombuffer(buffer, dtype=np.int16, count=filled // 2)
+                if filled < len(buffer):
+                    finished = True
+                    break
+        finally:
+            # A consumer that stopped early does not need the rest of the stream
+            if not finished:
+                process.kill()
+            process.stdout.close()
+            returncode = process.wait()
+        if returncode != 0:
+            errors.seek(0)
+            raise RuntimeError(f"Failed to load audio: {errors.read().decode(errors='replace')}")
+
+
+# Generator over a recording as consecutive float32 blocks of 16 kHz mono samples;
+# memory use is one block regardless of the recording's length
+def iter_audio_blocks(file_path, block_samples=DECODE_BLOCK_SAMPLES, sample_rate=SAMPLE_RATE):
+    for pcm in _pcm_blocks(file_path, block_samples, sample_rate):
+        yield pcm.astype(np.float32) / 32768.0
+
+
+# Function to decode any ffmpeg-readable file once, block by block. Recordings shorter
+# than DECODE_MMAP_SECONDS go straight into shared memory; longer ones (or ones whose
+# length cannot be probed) are written to a file in DECODE_MMAP_DIR and memory-mapped.
+def decode_audio(file_path, sample_rate=SAMPLE_RATE):
+    expected = probe_duration(file_path)
+    if 0 < expected < DECODE_MMAP_SECONDS:
+        # One second of headroom covers container durations that are slightly short
+        return _decode_to_shared(file_path, int((expected + 1) * sample_rate), sample_rate)
+    return _decode_to_file(file_path, sample_rate)
+
+
+def _decode_to_shared(file_path, capacity, sample_rate):
+    audio = SharedAudio.create(capacity)
+    written = 0
+    try:
+        for pcm in _pcm_blocks(file_path, DECODE_BLOCK_SAMPLES, sample_rate):
+            if written + len(pcm) > capacity:
+                capacity = max(capacity * 2, written + len(pcm))
+                grown = SharedAudio.create(capacity)
+                grown.array[:written] = audio.array[:written]
+                audio.close()
+                audio = grown
+            np.divide(pcm, 32768.0, out=audio.array[written:written + len(pcm)], casting="unsafe")
+            written += len(pcm)
+    except BaseException:
+        audio.close()
+        raise
+    audio.num_samples = written
+    audio.array = audio.array[:written]
+    return audio
+
+
+def _decode_to_file(file_path, sample_rate):
+    os.makedirs(DECODE_MMAP_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(suffix=".f32", dir=DECODE_MMAP_DIR)
+    written = 0
+    try:
+        with os.fdopen(fd, "wb") as f:
+            block = np.empty(DECODE_BLOCK_SAMPLES, dtype=np.float32)
+            for pcm in _pcm_blocks(file_path, DECODE_BLOCK_SAMPLES, sample_rate):
+                out = block[:len(pcm)]
+                np.divide(pcm, 32768.0, out=out, casting="unsafe")
+                f.write(out.tobytes())
+                written += len(pcm)
+    except BaseException:
+        os.remove(path)
+        raise
+    return MappedAudio(path, written, owner=True)
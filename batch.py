@@ -0,0 +1,173 @@
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+# Pipelines run at once; each shard gets its own models and a disjoint CPU slice
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "2"))
+
+# Files picked up when walking the input directory
+AUDIO_EXTENSIONS = {".wav", ".mp3", ".m4a", ".flac", ".ogg", ".opus", ".webm", ".mp4", ".aac", ".wma"}
+
+MANIFEST_NAME = "manifest.jsonl"
+
+DONE = "done"
+FAILED = "failed"
+
+
+# Runs once in every shard: pin to its CPU slice before torch is imported, and give the
+# shard one Whisper process of its own unless configured otherwise
+def _init_shard(cpu_sets):
+    cpus = cpu_sets.get()
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    os.environ.setdefault("INFERENCE_WORKERS", "1")
+    os.environ.setdefault("MODEL_WARMUP", "0")
+
+
+# Runs inside a shard: the same pipeline as POST /transcribe, rendered to a file
+def _process(file_path, output_path, output_format):
+    from transcribe import process_audio
+    from rendering import FORMATS
+
+    start = time.perf_counter()
+    result = process_audio(file_path)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for chunk in FORMATS[output_format][1](result):
+            f.write(chunk)
+    os.replace(tmp_path, output_path)
+    return time.perf_counter() - start
+
+
+def find_audio_files(input_dir):
+    files = []
+    for root, _, names in os.walk(input_dir):
+        for name in names:
+            if os.path.splitext(name)[1].lower() in AUDIO_EXTENSIONS:
+                files.append(os.path.join(root, name))
+    return sorted(files)
+
+
+# Appends one JSON line per finished file and flushes it to disk, so an interrupted run
+# loses at most the files that were still in progress
+class Manifest:
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A line cut short by a crash
+                        continue
+                    self.entries[entry["file"]] = entry
+        self._file = open(path, "a", encoding="utf-8")
+
+    # A file is skipped only if it finished and has not changed since
+    def is_done(self, name, stat, output_path):
+        entry = self.entries.get(name)
+        return (
+            entry is not None and entry["status"] == DONE
+            and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime
+            and os.path.exists(output_path)
+        )
+
+    def record(self, name, stat, status, **fields):
+        entry = {"file": name, "status": status, "size": stat.st_size, "mtime": stat.st_mtime, **fields}
+        self.entries[name] = entry
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+# Function to transcribe every audio file under input_dir into output_dir. Files are
+# sharded across a process pool longest first, so one long recording does not end up
+# alone at the tail of the run, and each result is written as soon as it is ready.
+def run_batch(input_dir, output_dir, workers=BATCH_WORKERS, output_format="json"):
+    from rendering import FORMATS
+    from audio import probe_duration
+    from inference_workers import partition_cpus
+
+    if output_format not in FORMATS:
+        raise ValueError(f"Unknown output format: {output_format}")
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = Manifest(os.path.join(output_dir, MANIFEST_NAME))
+
+    pending = []
+    skipped = 0
+    for file_path in find_audio_files(input_dir):
+        name = os.path.relpath(file_path, input_dir)
+        output_path = os.path.join(output_dir, f"{name}.{output_format}")
+        stat = os.stat(file_path)
+        if manifest.is_done(name, stat, output_path):
+            skipped += 1
+        else:
+            pending.append((file_path, name, output_path, stat))
+
+    with ThreadPoolExecutor(max_workers=8) as probe:
+        durations = list(probe.map(probe_duration, [file_path for file_path, *_ in pending]))
+    work = sorted(zip(durations, pending), key=lambda item: item[0], reverse=True)
+
+    context = multiprocessing.get_context("spawn")
+    cpu_sets, _ = partition_cpus(workers, reserve=0)
+    queue = context.Queue()
+    for cpus in cpu_sets:
+        queue.put(cpus)
+
+    completed = failed = 0
+    executor = ProcessPoolExecutor(
+        max_workers=len(cpu_sets), mp_context=context, initializer=_init_shard, initargs=(queue,)
+    )
+    try:
+        futures = {
+            executor.submit(_process, file_path, output_path, output_format): (name, output_path, stat, duration)
+            for duration, (file_path, name, output_path, stat) in work
+        }
+        print(f"{len(futures)} files to process, {skipped} already done", file=sys.stderr)
+        for future in as_completed(futures):
+            name, output_path, stat, duration = futures[future]
+            try:
+                seconds = future.result()
+            except Exception as e:
+                failed += 1
+                manifest.record(name, stat, FAILED, error=str(e))
+                print(f"failed {name}: {e}", file=sys.stderr)
+            else:
+                completed += 1
+                manifest.record(name, stat, DONE, output=os.path.relpath(output_path, output_dir),
+                                duration=duration, seconds=seconds)
+                print(f"[{completed + failed}/{len(futures)}] {name}", file=sys.stderr)
+    finally:
+        # On Ctrl-C, drop the queued files; the manifest already holds everything finished
+        executor.shutdown(wait=True, cancel_futures=True)
+        manifest.close()
+    return {"completed": completed, "failed": failed, "skipped": skipped}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Transcribe every audio file in a directory")
+    parser.add_argument("input_dir")
+    parser.add_argument("output_dir")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS,
+                        help="pipelines run in parallel (default: %(default)s)")
+    parser.add_argument("--format", default="json", choices=["json", "srt", "vtt", "html"],
+                        help="output format (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    summary = run_batch(args.input_dir, args.output_dir, args.workers, args.format)
+    print(json.dumps(summary))
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,151 @@
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future
+import numpy as np
+import torch
+from transformers import WhisperProcessor
+from audio import SAMPLE_RATE, SharedAudio
+from longform import stitch_futures
+from cache import MISSING, samples_hash
+from hf_whisper import WHISPER_DIR, WHISPER_PRECISION, load_whisper_model
+from word_timestamps import WORD_TIMESTAMPS, WordAligner, load_alignment_config
+
+# A batch is run as soon as it is full or its oldest window has waited this long
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = int(os.getenv("BATCH_MAX_WAIT_MS", "50"))
+
+# Whisper's encoder always sees 30 s of audio
+WINDOW_SECONDS = 30
+WINDOW_SAMPLES = WINDOW_SECONDS * SAMPLE_RATE
+
+
+class _Window:
+    def __init__(self, samples):
+        self.samples = samples
+        self.future = Future()
+
+
+# Collects 30 s windows from every in-flight request and runs them through the
+# encoder and decoder together, then hands each window's result back to its caller
+class WhisperBatcher:
+    def __init__(self, model_dir=WHISPER_DIR, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS,
+                 precision=WHISPER_PRECISION, word_timestamps=WORD_TIMESTAMPS, cache=None):
+        self.model_dir = model_dir
+        # Log-mel features of each window are cached here when given
+        self.cache = cache
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.processor = WhisperProcessor.from_pretrained(model_dir)
+        self.model = load_whisper_model(model_dir, precision, "eager" if word_timestamps else None)
+        self.aligner = None
+        if word_timestamps:
+            self.aligner = WordAligner(self.model, self.processor.tokenizer, *load_alignment_config(model_dir))
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name="whisper-batcher", daemon=True)
+        self._thread.start()
+
+    # Queue one window of at most 30 s; the Future resolves to its text and
+    # window-relative segments
+    def submit(self, samples):
+        window = _Window(samples)
+        self._queue.put(window)
+        return window.future
+
+    # Split a whole recording into windows, batch them with everyone else's and
+    # stitch the results back onto the recording's timeline
+    def submit_transcribe(self, audio):
+        num_samples = audio.num_samples if isinstance(audio, SharedAudio) else len(audio)
+        spans = [
+            (start, min(start + WINDOW_SAMPLES, num_samples))
+            for start in range(0, num_samples, WINDOW_SAMPLES)
+        ]
+        return self.submit_spans(audio, spans)
+
+    # Submit arbitrary (start, end) sample ranges of one recording and stitch them in order
+    def submit_spans(self, audio, spans):
+        samples = audio.array if isinstance(audio, SharedAudio) else np.asarray(audio, dtype=np.float32)
+        return stitch_futures([self.submit(samples[start:end]) for start, end in spans], spans)
+
+    def shutdown(self, wait=True):
+        self._queue.put(None)
+        if wait:
+            self._thread.join()
+
+    def _loop(self):
+        while True:
+            window = self._queue.get()
+            if window is None:
+                return
+            batch = [window]
+            deadline = time.monotonic() + self.max_wait
+            stop = False
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    window = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if window is None:
+                    stop = True
+                    break
+                batch.append(window)
+
+            self._run_batch(batch)
+            if stop:
+                return
+
+    def _run_batch(self, batch):
+        batch = [window for window in batch if window.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            features = self._features([window.samples for window in batch])
+            with torch.inference_mode():
+                # Run the encoder once; word alignment reuses its output
+                encoder_outputs = self.model.get_encoder()(features)
+                sequences = self.model.generate(encoder_outputs=encoder_outputs, return_timestamps=True)
+            decoded = self.processor.batch_decode(sequences, skip_special_tokens=True, output_offsets=True)
+            words = [None] * len(batch)
+            if self.aligner is not None:
+                words = self.aligner.align(encoder_outputs, sequences, [len(window.samples) for window in batch])
+        except Exception as e:
+            for window in batch:
+                window.future.set_exception(e)
+            return
+
+        for window, output, window_words in zip(batch, decoded, words):
+            result = {
+                "text": output["text"],
+                "segments": [
+                    {"start": offset["timestamp"][0], "end": offset["timestamp"][1], "text": offset["text"]}
+                    for offset in output.get("offsets", [])
+                ],
+            }
+            if window_words is not None:
+                result["words"] = window_words
+            window.future.set_result(result)
+
+
+    # Log-mel features for a batch of windows, keyed like every other stage on the
+    # window's samples; only the windows missing from the cache are extracted
+    def _features(self, windows):
+        if self.cache is None:
+            return self.processor.feature_extractor(
+                windows, sampling_rate=SAMPLE_RATE, return_tensors="pt"
+            ).input_features
+        params = {"model": self.model_dir, "sampling_rate": SAMPLE_RATE}
+        keys = [self.cache.key(samples_hash(samples), "features", params) for samples in windows]
+        rows = [self.cache.get(key) for key in keys]
+        missing = [i for i, row in enumerate(rows) if row is MISSING]
+        if missing:
+            extracted = self.processor.feature_extractor(
+                [windows[i] for i in missing], sampling_rate=SAMPLE_RATE, return_tensors="np"
+            ).input_features
+            for i, row in zip(missing, extracted):
+                rows[i] = row
+                self.cache.put(keys[i], row)
+        return torch.from_numpy(np.stack(rows))
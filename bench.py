@@ -0,0 +1,241 @@
+import os
+import sys
+import math
+import json
+import time
+import argparse
+import platform
+import resource
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+# Fixture lengths in seconds used when none are given
+DEFAULT_DURATIONS = (30, 120, 600)
+
+STAGES = ("decode", "whisper", "diarization", "alignment", "sentiment", "render")
+
+
+# Function to build one fixture per duration. A source clip is looped to each length;
+# without one, a speech-band tone over pink noise keeps every stage busy.
+def make_fixtures(durations, directory, source=None):
+    fixtures = []
+    for duration in durations:
+        path = os.path.join(directory, f"fixture-{duration}s.wav")
+        if source:
+            inputs = ["-stream_loop", "-1", "-i", source]
+        else:
+            inputs = [
+                "-f", "lavfi", "-i", f"sine=frequency=220:sample_rate=16000:duration={duration}",
+                "-f", "lavfi", "-i", f"anoisesrc=color=pink:amplitude=0.05:sample_rate=16000:duration={duration}",
+                "-filter_complex", "amix=inputs=2",
+            ]
+        cmd = ["ffmpeg", "-nostdin", "-y", "-loglevel", "error", *inputs, "-t", str(duration), "-ac", "1", "-ar", "16000", path]
+        subprocess.run(cmd, check=True)
+        fixtures.append({"file": path, "duration": float(duration)})
+    return fixtures
+
+
+# Function to list the audio files of a fixture directory with their durations
+def load_fixtures(directory):
+    from audio import decode_audio
+
+    fixtures = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if name.endswith(".txt") or not os.path.isfile(path):
+            continue
+        with decode_audio(path) as audio:
+            fixtures.append({"file": path, "duration": audio.duration})
+    return fixtures
+
+
+# Tracks the largest resident set of this process plus its children (the inference
+# workers), sampled every interval, since ru_maxrss only covers children that exited
+class PeakRss:
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, _tree_rss(os.getpid()))
+
+
+def _tree_rss(pid):
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+                        break
+            with open(f"/proc/{current}/task/{current}/children") as f:
+                pending.extend(int(child) for child in f.read().split())
+        except (OSError, ValueError):
+            continue
+    return total
+
+
+# Nearest-rank percentile of an unsorted list
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), math.ceil(q / 100 * len(ordered))))
+    return ordered[rank - 1]
+
+
+def summarize(values, duration=None):
+    if not values:
+        return None
+    summary = {
+        "mean": sum(values) / len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values),
+    }
+    if duration:
+        summary["rtf_mean"] = summary["mean"] / duration
+        summary["rtf_p95"] = summary["p95"] / duration
+    return summary
+
+
+# Function to run one fixture through the same path as POST /transcribe: decode,
+# Whisper and diarization in parallel, alignment, sentiment, then the HTML report
+def run_once(fixture, cache):
+    from transcribe import process_audio, generate_html
+    from metrics import stage_timer
+
+    timings = {}
+    start = time.perf_counter()
+    result = process_audio(fixture["file"], timings, cache, store=False)
+    with stage_timer("render", timings):
+        generate_html(result["transcription"], result["sentiment"], result["diarization"])
+    return {
+        "file": os.path.basename(fixture["file"]),
+        "duration": fixture["duration"],
+        "latency": time.perf_counter() - start,
+        "stages": timings,
+    }
+
+
+def run_benchmark(fixtures, concurrency=1, repeat=3, warmup=1):
+    from transcribe import model_registry
+    from cache import ArtifactCache
+
+    # A cache with no budget stores nothing, so every run recomputes every stage
+    scratch = tempfile.mkdtemp(prefix="bench-cache-")
+    cache = ArtifactCache(directory=scratch, memory_bytes=0, disk_bytes=0)
+
+    start = time.perf_counter()
+    model_registry.warm_up().join()
+    load_seconds = time.perf_counter() - start
+    shortest = min(fixtures, key=lambda fixture: fixture["duration"])
+    for _ in range(warmup):
+        run_once(shortest, cache)
+
+    jobs = [fixture for fixture in fixtures for _ in range(repeat)]
+    with PeakRss() as rss, ThreadPoolExecutor(max_workers=concurrency) as executor:
+        start = time.perf_counter()
+        runs = list(executor.map(lambda fixture: run_once(fixture, cache), jobs))
+        wall = time.perf_counter() - start
+
+    by_duration = {}
+    for run in runs:
+        by_duration.setdefault(run["duration"], []).append(run)
+    per_duration = []
+    for duration, group in sorted(by_duration.items()):
+        per_duration.append({
+            "duration": duration,
+            "runs": len(group),
+            "latency": summarize([run["latency"] for run in group], duration),
+            "stages": {
+                stage: summarize([run["stages"][stage] for run in group if stage in run["stages"]], duration)
+                for stage in STAGES
+            },
+        })
+
+    audio_seconds = sum(run["duration"] for run in runs)
+    return {
+        "config": {"concurrency": concurrency, "repeat": repeat, "warmup": warmup},
+        "environment": _environment(),
+        "model_load_seconds": load_seconds,
+        "wall_seconds": wall,
+        "throughput": {
+            "files_per_second": len(runs) / wall,
+            "audio_seconds_per_second": audio_seconds / wall,
+        },
+        "peak_rss_bytes": rss.peak,
+        "results": per_duration,
+        "runs": runs,
+    }
+
+
+def _environment():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "settings": {
+            name: os.environ[name] for name in (
+                "WHISPER_BACKEND", "WHISPER_MODEL", "WHISPER_PRECISION", "INFERENCE_WORKERS",
+                "LONGFORM_MODE", "WORD_TIMESTAMPS", "BATCH_MAX_SIZE", "DIARIZATION_WORKERS",
+            ) if name in os.environ
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the transcription pipeline stage by stage")
+    parser.add_argument("--fixtures", help="directory of audio files to use instead of generated fixtures")
+    parser.add_argument("--source", help="clip looped to each duration when generating fixtures")
+    parser.add_argument("--durations", default=",".join(str(d) for d in DEFAULT_DURATIONS),
+                        help="comma-separated fixture lengths in seconds (default: %(default)s)")
+    parser.add_argument("--concurrency", type=int, default=1, help="pipelines run at once (default: 1)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per fixture (default: 3)")
+    parser.add_argument("--warmup", type=int, default=1, help="untimed runs before measuring (default: 1)")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="bench-fixtures-") as directory:
+        if args.fixtures:
+            fixtures = load_fixtures(args.fixtures)
+        else:
+            durations = [int(d) for d in args.durations.split(",") if d]
+            fixtures = make_fixtures(durations, directory, args.source)
+        report = run_benchmark(fixtures, args.concurrency, args.repeat, args.warmup)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
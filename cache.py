@@ -0,0 +1,241 @@
+import os
+import json
+import pickle
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+import numpy as np
+
+# On-disk tier location and size budgets (bytes) for both tiers
+ARTIFACT_CACHE_DIR = os.getenv("ARTIFACT_CACHE_DIR", "./cache")
+CACHE_MEMORY_BYTES = int(os.getenv("CACHE_MEMORY_BYTES", str(256 * 1024 ** 2)))
+CACHE_DISK_BYTES = int(os.getenv("CACHE_DISK_BYTES", str(10 * 1024 ** 3)))
+
+# Bump to invalidate every stored artifact after an incompatible pipeline change
+CACHE_VERSION = 1
+
+MISSING = object()
+
+
+# Function to hash the decoded samples, so re-encoded or renamed copies of a recording still match
+def audio_hash(audio):
+    return samples_hash(audio.array)
+
+
+# Function to hash a float32 sample array, e.g. one window of a recording
+def samples_hash(samples):
+    return hashlib.sha256(memoryview(np.ascontiguousarray(samples, dtype=np.float32)).cast("B")).hexdigest()
+
+
+# Function to hash arbitrary text, e.g. a transcript feeding a downstream stage
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# Artifacts are stored per stage under sha256(audio) + stage + parameter fingerprint,
+# so changing one stage's parameters only misses that stage. Values are kept pickled in
+# both tiers; callers always get a private copy they are free to mutate.
+class ArtifactCache:
+    def __init__(self, directory=ARTIFACT_CACHE_DIR, memory_bytes=CACHE_MEMORY_BYTES, disk_bytes=CACHE_DISK_BYTES):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._lock = threading.Lock()
+        self._disk_size = None
+        # Keys being computed right now, each with a Future of the pickled value
+        self._inflight = {}
+
+    def key(self, digest, stage, params):
+        fingerprint = json.dumps(params, sort_keys=True, default=str)
+        raw = f"{CACHE_VERSION}:{digest}:{stage}:{fingerprint}"
+        return f"{stage}-{hashlib.sha256(raw.encode('utf-8')).hexdigest()}"
+
+    def get(self, key):
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+        if data is None:
+            data = self._read_disk(key)
+            if data is None:
+                return MISSING
+            self._put_memory(key, data)
+        return pickle.loads(data)
+
+    def put(self, key, value):
+        self._put_data(key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+    # Function to look up a stage's artifact, computing and storing it on a miss. A caller
+    # that misses while the same key is already being computed waits for that result
+    # instead of computing it again.
+    def get_or_compute(self, digest, stage, params, compute):
+        key = self.key(digest, stage, params)
+        value = self.get(key)
+        if value is not MISSING:
+            return value
+        shared, owner = self._claim(key)
+        if not owner:
+            return pickle.loads(shared.result())
+        try:
+            value = compute()
+            data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except BaseException as e:
+            self._settle(key, shared, exception=e)
+            raise
+        try:
+            self._put_data(key, data)
+        finally:
+            self._settle(key, shared, data=data)
+        return value
+
+    # Same as get_or_compute for stages that run asynchronously: returns a Future that
+    # is already resolved on a hit. On a miss it resolves only once the value is stored,
+    # so a caller that mutates the result cannot race the pickling, and identical
+    # concurrent misses share one submission.
+    def submit_or_get(self, digest, stage, params, submit):
+        key = self.key(digest, stage, params)
+        future = Future()
+        value = self.get(key)
+        if value is not MISSING:
+            future.set_result(value)
+            return future
+
+        shared, owner = self._claim(key)
+        if owner:
+            def store(done):
+                if done.cancelled():
+                    self._settle(key, shared, cancelled=True)
+                    return
+                if done.exception() is not None:
+                    self._settle(key, shared, exception=done.exception())
+                    return
+                try:
+                    data = pickle.dumps(done.result(), protocol=pickle.HIGHEST_PROTOCOL)
+                except Exception as e:
+                    self._settle(key, shared, exception=e)
+                    return
+                # A failed write is reported by the executor's callback handler; the
+                # callers still get their result
+                try:
+                    self._put_data(key, data)
+                finally:
+                    self._settle(key, shared, data=data)
+
+            try:
+                submit().add_done_callback(store)
+            except BaseException as e:
+                self._settle(key, shared, exception=e)
+                raise
+
+        # Every caller gets its own copy of the stored value
+        def deliver(done):
+            if done.cancelled():
+                future.cancel()
+            elif done.exception() is not None:
+                future.set_exception(done.exception())
+            else:
+                future.set_result(pickle.loads(done.result()))
+
+        shared.add_done_callback(deliver)
+        return future
+
+    # Returns (in-flight Future of the pickled value, whether this caller must compute it)
+    def _claim(self, key):
+        with self._lock:
+            shared = self._inflight.get(key)
+            if shared is not None:
+                return shared, False
+            shared = self._inflight[key] = Future()
+            return shared, True
+
+    # Publish the outcome to every waiter; stored values are already readable by then
+    def _settle(self, key, shared, data=None, exception=None, cancelled=False):
+        with self._lock:
+            self._inflight.pop(key, None)
+        if cancelled:
+            shared.cancel()
+        elif exception is not None:
+            shared.set_exception(exception)
+        else:
+            shared.set_result(data)
+
+    def _put_data(self, key, data):
+        self._put_memory(key, data)
+        self._write_disk(key, data)
+
+    def _put_memory(self, key, data):
+        if len(data) > self.memory_bytes:
+            return
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._memory_size -= len(old)
+            self._memory[key] = data
+            self._memory_size += len(data)
+            while self._memory_size > self.memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_size -= len(evicted)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[-2:], key + ".pkl")
+
+    def _read_disk(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        # Touch the file so disk eviction is least-recently-used rather than oldest-written
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def _write_disk(self, key, data):
+        if not self.disk_bytes or len(data) > self.disk_bytes:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            if self._disk_size is None:
+                self._disk_size = sum(size for _, size, _ in self._disk_entries())
+            else:
+                self._disk_size += len(data)
+            if self._disk_size > self.disk_bytes:
+                self._evict_disk()
+
+    def _disk_entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".pkl"):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    yield path, stat.st_size, stat.st_mtime
+
+    # Delete least recently used files until the disk tier is back under 90% of its budget
+    def _evict_disk(self):
+        entries = sorted(self._disk_entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.disk_bytes * 0.9
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._disk_size = total
@@ -1,22 +1,356 @@
+import os
+import json
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
+import numpy as np
 import torch
 
-def add_speaker_embedding(name, embedding):
-    conn = sqlite3.connect('speakers.db')
-    c = conn.cursor()
-    c.execute("INSERT INTO speakers (name, embedding) VALUES (?, ?)", (name, embedding))
+DB_PATH = 'speakers.db'
+
+# Rows written by this module are stored L2-normalized with their dimension, dtype
+# and embedding model. Rows without a format_version are legacy raw float32 BLOBs.
+EMBEDDING_FORMAT_VERSION = 1
+
+# Model that produced the embeddings (the ECAPA checkpoint cached under tmp/)
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "speechbrain/spkrec-ecapa-voxceleb")
+
+# Storage precision: "float32", "float16" or "int8" (symmetric, one scale per row)
+EMBEDDING_DTYPE = os.getenv("EMBEDDING_DTYPE", "float32")
+
+# Bulk snapshot of all embeddings as a memory-mappable matrix, plus a JSON sidecar
+SNAPSHOT_PATH = os.getenv("EMBEDDING_SNAPSHOT_PATH", os.path.splitext(DB_PATH)[0] + ".embeddings.npy")
+
+# Connections kept open per database file
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+
+# Applied to every pooled connection. WAL lets readers run alongside a writer, and
+# synchronous=NORMAL is durable under WAL while syncing only at checkpoints.
+_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA busy_timeout=5000",
+]
+
+# Statements are kept as constants so sqlite3's per-connection statement cache reuses
+# the compiled form on every call
+_INSERT_SPEAKER = (
+    "INSERT INTO speakers (name, embedding, format_version, dim, dtype, scale, model) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+_SELECT_SPEAKERS = (
+    "SELECT id, name, embedding, format_version, dtype, scale FROM speakers WHERE id > ? ORDER BY id"
+)
+
+_FORMAT_COLUMNS = [
+    ("format_version", "INTEGER"),
+    ("dim", "INTEGER"),
+    ("dtype", "TEXT"),
+    ("scale", "REAL"),
+    ("model", "TEXT"),
+]
+
+# Thread-safe pool of open connections to one database file. A connection is only
+# ever used by one thread at a time, so check_same_thread can be relaxed. migrate
+# creates or upgrades the file's schema when the pool is opened.
+class ConnectionPool:
+    def __init__(self, db_path=DB_PATH, size=DB_POOL_SIZE, migrate=None):
+        self.db_path = db_path
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        with self.connection() as conn:
+            (migrate or _migrate)(conn)
+
+    @contextmanager
+    def connection(self):
+        self._slots.acquire()
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._open()
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            self._idle.put(conn)
+        finally:
+            self._slots.release()
+
+    # Run the body in one transaction: committed on success, rolled back on error
+    @contextmanager
+    def transaction(self):
+        with self.connection() as conn:
+            with conn:
+                yield conn
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def _open(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, cached_statements=256)
+        for pragma in _PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+# Function to get the shared pool for a database file, creating it on first use
+def get_pool(db_path=DB_PATH, migrate=None):
+    with _pools_lock:
+        pool = _pools.get(db_path)
+        if pool is None:
+            pool = _pools[db_path] = ConnectionPool(db_path, migrate=migrate)
+        return pool
+
+# Create the speakers table (and any missing columns) if needed
+def init_db(db_path=DB_PATH):
+    get_pool(db_path)
+
+# Add the format columns to a speakers table created before they existed
+def _migrate(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS speakers
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, embedding BLOB)''')
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(speakers)")}
+    for column, column_type in _FORMAT_COLUMNS:
+        if column not in existing:
+            conn.execute(f"ALTER TABLE speakers ADD COLUMN {column} {column_type}")
     conn.commit()
-    conn.close()
+
+# Function to normalize an embedding and pack it in the requested precision.
+# Returns (blob, dim, dtype, scale); scale is only used for int8.
+def encode_embedding(embedding, dtype=EMBEDDING_DTYPE):
+    if isinstance(embedding, (bytes, bytearray, memoryview)):
+        vector = np.frombuffer(embedding, dtype=np.float32)
+    elif isinstance(embedding, torch.Tensor):
+        vector = embedding.detach().cpu().to(torch.float32).flatten().numpy()
+    else:
+        vector = np.asarray(embedding, dtype=np.float32).flatten()
+    vector = vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    if dtype == "float32":
+        return vector.astype(np.float32).tobytes(), len(vector), dtype, None
+    if dtype == "float16":
+        return vector.astype(np.float16).tobytes(), len(vector), dtype, None
+    if dtype == "int8":
+        scale = max(float(np.abs(vector).max()), 1e-12) / 127
+        quantized = np.clip(np.round(vector / scale), -127, 127).astype(np.int8)
+        return quantized.tobytes(), len(vector), dtype, scale
+    raise ValueError(f"Unsupported embedding dtype: {dtype}")
+
+# Function to turn a stored row back into a normalized float32 tensor
+def decode_embedding(blob, format_version=None, dtype=None, scale=None):
+    if format_version is None:
+        # Legacy rows: raw float32 as written by earlier versions, not normalized
+        vector = torch.frombuffer(bytearray(blob), dtype=torch.float32)
+        return torch.nn.functional.normalize(vector, dim=0)
+    if dtype == "float32":
+        return torch.frombuffer(bytearray(blob), dtype=torch.float32)
+    if dtype == "float16":
+        return torch.frombuffer(bytearray(blob), dtype=torch.float16).to(torch.float32)
+    if dtype == "int8":
+        return torch.frombuffer(bytearray(blob), dtype=torch.int8).to(torch.float32) * scale
+    raise ValueError(f"Unsupported embedding dtype: {dtype}")
+
+def add_speaker_embedding(name, embedding, model=EMBEDDING_MODEL, dtype=EMBEDDING_DTYPE):
+    add_speaker_embeddings([(name, embedding)], model, dtype)
+
+# Function to enroll many (name, embedding) pairs in a single transaction, so the whole
+# batch costs one commit instead of one fsync per row
+def add_speaker_embeddings(speakers, model=EMBEDDING_MODEL, dtype=EMBEDDING_DTYPE, db_path=DB_PATH):
+    encoded = [(name,) + encode_embedding(embedding, dtype) for name, embedding in speakers]
+    inserted = []
+    with get_pool(db_path).transaction() as conn:
+        c = conn.cursor()
+        for name, blob, dim, row_dtype, scale in encoded:
+            c.execute(_INSERT_SPEAKER, (name, blob, EMBEDDING_FORMAT_VERSION, dim, row_dtype, scale, model))
+            inserted.append((c.lastrowid, name, decode_embedding(blob, EMBEDDING_FORMAT_VERSION, row_dtype, scale)))
+
+    for index in _indexes:
+        for row_id, name, vector in inserted:
+            index.add(row_id, name, vector)
+    return [row_id for row_id, _, _ in inserted]
+
+# Register an index whose add(row_id, name, embedding) is called for every inserted
+# speaker; the embedding is passed as a normalized float32 tensor
+def register_index(index):
+    _indexes.append(index)
+
+# Function to read (id, name, normalized float32 tensor) for every speaker with id > after_id
+def read_speaker_embeddings(db_path=DB_PATH, after_id=0):
+    with get_pool(db_path).connection() as conn:
+        rows = conn.execute(_SELECT_SPEAKERS, (after_id,)).fetchall()
+    return [(row_id, name, decode_embedding(blob, version, dtype, scale))
+            for row_id, name, blob, version, dtype, scale in rows]
 
 def get_all_speaker_embeddings():
-    conn = sqlite3.connect('speakers.db')
-    c = conn.cursor()
-    c.execute("SELECT name, embedding FROM speakers")
-    results = c.fetchall()
-    conn.close()
-    
-    speakers = []
-    for name, embedding in results:
-        tensor_embedding = torch.frombuffer(embedding, dtype=torch.float32)
-        speakers.append((name, tensor_embedding))
-    return speakers
+    return [(name, embedding) for _, name, embedding in read_speaker_embeddings()]
+
+# Function to write every embedding as one float32 .npy matrix with a JSON sidecar of
+# ids and names, so workers can start from a memory map instead of decoding BLOBs
+def export_snapshot(path=SNAPSHOT_PATH, db_path=DB_PATH):
+    rows = read_speaker_embeddings(db_path)
+    dim = len(rows[0][2]) if rows else 0
+    matrix = np.lib.format.open_memmap(f"{path}.tmp.npy", mode="w+", dtype=np.float32, shape=(len(rows), dim))
+    for i, (_, _, embedding) in enumerate(rows):
+        matrix[i] = embedding.numpy()
+    matrix.flush()
+    del matrix
+    meta = {
+        "format_version": EMBEDDING_FORMAT_VERSION,
+        "dim": dim,
+        "max_id": rows[-1][0] if rows else 0,
+        "ids": [row[0] for row in rows],
+        "names": [row[1] for row in rows],
+    }
+    with open(f"{path}.tmp.json", "w") as f:
+        json.dump(meta, f)
+    # Sidecar first, so a reader never pairs a new matrix with old names
+    os.replace(f"{path}.tmp.json", f"{path}.json")
+    os.replace(f"{path}.tmp.npy", path)
+    return len(rows)
+
+# Function to open a snapshot as a copy-on-write memory map; returns (matrix, meta) or None
+def load_snapshot(path=SNAPSHOT_PATH):
+    try:
+        with open(f"{path}.json") as f:
+            meta = json.load(f)
+        matrix = np.load(path, mmap_mode="c")
+    except FileNotFoundError:
+        return None
+    if meta.get("format_version") != EMBEDDING_FORMAT_VERSION or len(meta["ids"]) != len(matrix):
+        return None
+    return matrix, meta
+
+# In-memory index of every enrolled speaker: one contiguous matrix of L2-normalized
+# embeddings, so a batch of queries is matched with a single matrix multiply.
+# It is loaded on first use (from the snapshot's memory map when there is one) and
+# kept current by add_speaker_embedding.
+class SpeakerIndex:
+    def __init__(self, db_path=DB_PATH, snapshot_path=SNAPSHOT_PATH):
+        self.db_path = db_path
+        self.snapshot_path = snapshot_path
+        self._lock = threading.Lock()
+        self._matrix = None
+        self._size = 0
+        self._names = []
+        self._ids = []
+        # Largest row id held; rows at or below it are already in the index
+        self._max_id = 0
+
+    def __len__(self):
+        with self._lock:
+            self._ensure_loaded()
+            return self._size
+
+    # Return the k best (name, cosine similarity) matches for each query embedding
+    def search(self, queries, k=1):
+        queries = _as_matrix(queries)
+        with self._lock:
+            self._ensure_loaded()
+            if self._size == 0:
+                return [[] for _ in range(queries.shape[0])]
+            scores = _normalize(queries) @ self._matrix[:self._size].T
+            top_scores, top_rows = scores.topk(min(k, self._size), dim=1)
+            names = list(self._names)
+        return [
+            [(names[row], score) for row, score in zip(rows.tolist(), row_scores.tolist())]
+            for rows, row_scores in zip(top_rows, top_scores)
+        ]
+
+    # Append a newly inserted row; a no-op until the index has been loaded, or when a load
+    # that ran after the insert committed already read the row
+    def add(self, row_id, name, embedding):
+        with self._lock:
+            if self._matrix is None or row_id <= self._max_id:
+                return
+            self._append([row_id], [name], _normalize(_as_matrix(embedding)))
+
+    # Drop everything; the next query reloads from the database
+    def invalidate(self):
+        with self._lock:
+            self._reset()
+
+    def _reset(self):
+        self._matrix = None
+        self._size = 0
+        self._names = []
+        self._ids = []
+        self._max_id = 0
+
+    # The index only counts as loaded once loading succeeded; a failed load is retried
+    # by the next query
+    def _ensure_loaded(self):
+        if self._matrix is not None:
+            return
+        try:
+            self._load()
+        except BaseException:
+            self._reset()
+            raise
+
+    def _load(self):
+        self._matrix = torch.empty((0, 0))
+        after_id = 0
+        snapshot = load_snapshot(self.snapshot_path)
+        if snapshot is not None:
+            matrix, meta = snapshot
+            # Zero-copy: the tensor shares the mapped pages until a later insert grows it
+            self._matrix = torch.from_numpy(matrix)
+            self._size = len(meta["ids"])
+            self._ids = list(meta["ids"])
+            self._names = list(meta["names"])
+            self._max_id = after_id = meta["max_id"]
+
+        rows = read_speaker_embeddings(self.db_path, after_id)
+        if rows:
+            embeddings = torch.stack([embedding for _, _, embedding in rows])
+            self._append([row[0] for row in rows], [row[1] for row in rows], _normalize(embeddings))
+
+    # Grow the matrix geometrically so repeated inserts stay amortized O(1)
+    def _append(self, ids, names, embeddings):
+        needed = self._size + embeddings.shape[0]
+        if self._matrix.shape[0] < needed or self._matrix.shape[1] != embeddings.shape[1]:
+            if self._size and self._matrix.shape[1] != embeddings.shape[1]:
+                raise ValueError(
+                    f"Embedding has dimension {embeddings.shape[1]}, index holds {self._matrix.shape[1]}"
+                )
+            grown = torch.empty((max(needed, 2 * self._matrix.shape[0]), embeddings.shape[1]))
+            if self._size:
+                grown[:self._size] = self._matrix[:self._size]
+            self._matrix = grown
+        self._matrix[self._size:needed] = embeddings
+        self._size = needed
+        self._ids.extend(ids)
+        self._names.extend(names)
+        self._max_id = max(self._max_id, max(ids))
+
+def _as_matrix(embeddings):
+    if isinstance(embeddings, (list, tuple)):
+        embeddings = torch.stack([torch.as_tensor(e, dtype=torch.float32).flatten() for e in embeddings])
+    embeddings = torch.as_tensor(embeddings, dtype=torch.float32)
+    return embeddings.unsqueeze(0) if embeddings.dim() == 1 else embeddings
+
+def _normalize(embeddings):
+    return torch.nn.functional.normalize(embeddings, dim=1)
+
+speaker_index = SpeakerIndex()
+_indexes = [speaker_index]
+
+if __name__ == '__main__':
+    # python database.py snapshot  -> export the memory-mappable embedding matrix
+    import sys
+    if len(sys.argv) >= 2 and sys.argv[1] == "snapshot":
+        print(f"Exported {export_snapshot()} embeddings to {SNAPSHOT_PATH}")
+    else:
+        print("usage: python database.py snapshot")
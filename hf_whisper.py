@@ -0,0 +1,130 @@
+import os
+import sys
+import json
+import time
+import torch
+from transformers import WhisperProcessor, WhisperForConditionalGeneration
+
+# Checkpoint saved by download_model.py
+WHISPER_DIR = os.getenv("WHISPER_DIR", "./whisper")
+
+# "float32" uses the checkpoint as saved; "int8" dynamically quantizes its Linear layers
+WHISPER_PRECISION = os.getenv("WHISPER_PRECISION", "float32")
+
+# Quantized models are cached here so later startups skip quantization
+QUANTIZED_CACHE_DIR = os.getenv("QUANTIZED_CACHE_DIR", os.path.join(os.getenv("ARTIFACT_CACHE_DIR", "./cache"), "quantized"))
+
+
+# Function to load the ./whisper checkpoint in the requested precision. Word timestamps
+# need attn_implementation="eager": the default sdpa attention returns no weights.
+def load_whisper_model(model_dir=WHISPER_DIR, precision=WHISPER_PRECISION, attn_implementation=None):
+    options = {"attn_implementation": attn_implementation} if attn_implementation else {}
+    if precision == "float32":
+        return WhisperForConditionalGeneration.from_pretrained(model_dir, **options).eval()
+    if precision != "int8":
+        raise ValueError(f"Unsupported Whisper precision: {precision}")
+
+    cache_path = _quantized_cache_path(model_dir, attn_implementation)
+    if os.path.exists(cache_path):
+        return torch.load(cache_path, weights_only=False).eval()
+
+    model = WhisperForConditionalGeneration.from_pretrained(model_dir, **options).eval()
+    model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    torch.save(model, tmp_path)
+    os.replace(tmp_path, cache_path)
+    return model
+
+
+# The cache file name changes whenever the weights or the torch version change, since
+# a pickled quantized module is only valid for the build that produced it, and the
+# attention implementation is pickled with it
+def _quantized_cache_path(model_dir, attn_implementation=None):
+    weights = os.path.join(model_dir, "model.safetensors")
+    stamp = int(os.stat(weights).st_mtime) if os.path.exists(weights) else 0
+    attention = f"-{attn_implementation}" if attn_implementation else ""
+    name = f"whisper-int8-{os.path.basename(os.path.abspath(model_dir))}-{stamp}{attention}-torch{torch.__version__}.pt"
+    return os.path.join(QUANTIZED_CACHE_DIR, name.replace("+", "_"))
+
+
+# Function to compute word error rate between a reference and a hypothesis
+def word_error_rate(reference, hypothesis):
+    ref = reference.lower().split()
+    hyp = hypothesis.lower().split()
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i] + [0] * len(hyp)
+        for j, hyp_word in enumerate(hyp, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word))
+        previous = current
+    return previous[-1] / len(ref)
+
+
+def _transcribe_fixture(processor, model, samples):
+    features = processor.feature_extractor(samples, sampling_rate=16000, return_tensors="pt").input_features
+    start = time.perf_counter()
+    with torch.inference_mode():
+        tokens = model.generate(features)
+    elapsed = time.perf_counter() - start
+    return processor.batch_decode(tokens, skip_special_tokens=True)[0].strip(), elapsed
+
+
+# Function to compare int8 against float32 on a directory of fixture clips (at most 30 s
+# each). A clip's reference transcript is read from a .txt file with the same name if
+# present; otherwise the float32 output is used as the reference.
+def compare_precisions(fixture_dir, model_dir=WHISPER_DIR):
+    from audio import decode_audio
+
+    processor = WhisperProcessor.from_pretrained(model_dir)
+    models = {}
+    for precision in ("float32", "int8"):
+        start = time.perf_counter()
+        models[precision] = load_whisper_model(model_dir, precision)
+        models[precision + "_load_seconds"] = time.perf_counter() - start
+
+    clips = []
+    for name in sorted(os.listdir(fixture_dir)):
+        path = os.path.join(fixture_dir, name)
+        if name.endswith(".txt") or not os.path.isfile(path):
+            continue
+        with decode_audio(path) as audio:
+            samples = audio.array.copy()
+        float_text, float_seconds = _transcribe_fixture(processor, models["float32"], samples)
+        int8_text, int8_seconds = _transcribe_fixture(processor, models["int8"], samples)
+
+        reference_path = os.path.splitext(path)[0] + ".txt"
+        if os.path.exists(reference_path):
+            with open(reference_path) as f:
+                reference = f.read()
+        else:
+            reference = float_text
+        clips.append({
+            "file": name,
+            "float32_seconds": float_seconds,
+            "int8_seconds": int8_seconds,
+            "float32_wer": word_error_rate(reference, float_text),
+            "int8_wer": word_error_rate(reference, int8_text),
+        })
+
+    float_total = sum(clip["float32_seconds"] for clip in clips)
+    int8_total = sum(clip["int8_seconds"] for clip in clips)
+    count = max(1, len(clips))
+    return {
+        "clips": clips,
+        "float32_load_seconds": models["float32_load_seconds"],
+        "int8_load_seconds": models["int8_load_seconds"],
+        "speedup": float_total / int8_total if int8_total else None,
+        "float32_mean_wer": sum(clip["float32_wer"] for clip in clips) / count,
+        "int8_mean_wer": sum(clip["int8_wer"] for clip in clips) / count,
+    }
+
+
+if __name__ == '__main__':
+    # python hf_whisper.py compare <fixture_dir>
+    if len(sys.argv) == 3 and sys.argv[1] == "compare":
+        print(json.dumps(compare_precisions(sys.argv[2]), indent=2))
+    else:
+        print("usage: python hf_whisper.py compare <fixture_dir>")
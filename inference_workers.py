@@ -0,0 +1,177 @@
+import os
+import queue
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from audio import SharedAudio
+from longform import stitch_futures
+from word_timestamps import WORD_TIMESTAMPS
+
+# Number of inference processes, each holding its own copy of the Whisper model
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "2"))
+
+# Whisper checkpoint loaded by every worker
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "large-v2")  # Change to "large-v3" if necessary
+
+# CPUs kept back for the web process (diarization, sentiment); defaults to one worker's share
+WEB_CPU_RESERVE = os.getenv("WEB_CPU_RESERVE")
+
+# Model held by the current worker process
+_whisper_model = None
+
+
+# Function to split the available CPUs into a reserved set for the web process
+# and one disjoint set per worker
+def partition_cpus(num_workers, reserve=None):
+    if hasattr(os, "sched_getaffinity"):
+        cpus = sorted(os.sched_getaffinity(0))
+    else:
+        cpus = list(range(os.cpu_count() or 1))
+    num_workers = max(1, min(num_workers, len(cpus)))
+    if reserve is None:
+        reserve = len(cpus) // (num_workers + 1)
+    reserve = int(reserve)
+    if len(cpus) - reserve < num_workers:
+        # Too few cores to give everyone their own; let the web process share them
+        reserve = 0
+
+    reserved, cpus = cpus[:reserve], cpus[reserve:]
+    size = len(cpus) // num_workers
+    return [cpus[i * size:(i + 1) * size] for i in range(num_workers)], reserved
+
+
+# Function to pin the whole process to a CPU set. sched_setaffinity(0) only affects the
+# calling thread on Linux, so every thread that already exists is pinned as well; threads
+# started later inherit the affinity of the thread that creates them.
+def pin_process(cpus):
+    if not hasattr(os, "sched_setaffinity"):
+        return
+    try:
+        threads = [int(tid) for tid in os.listdir("/proc/self/task")]
+    except OSError:
+        threads = [0]
+    for tid in threads:
+        try:
+            os.sched_setaffinity(tid, cpus)
+        except ProcessLookupError:
+            # The thread exited meanwhile
+            continue
+
+
+# Runs once in every worker: claim a CPU set, size torch's thread pool to it, load the
+# model and report the worker as loaded
+def _init_worker(cpu_sets, model_name, loaded=None):
+    global _whisper_model
+    cpus = cpu_sets.get()
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+
+    import torch
+    import whisper
+    torch.set_num_threads(len(cpus))
+    torch.set_num_interop_threads(1)
+    _whisper_model = whisper.load_model(model_name)
+    if loaded is not None:
+        loaded.put(os.getpid())
+
+
+def _ping():
+    return os.getpid()
+
+
+# Runs inside a worker; only the fields the web tier needs are sent back over IPC
+def _transcribe(audio, options):
+    if isinstance(audio, SharedAudio):
+        try:
+            result = _whisper_model.transcribe(audio.tensor, **options)
+        finally:
+            audio.close()
+    else:
+        result = _whisper_model.transcribe(audio, **options)
+    return _summarize(result)
+
+
+# Runs inside a worker: transcribe one chunk of a shared recording as an independent window
+def _transcribe_span(audio, start, end, options):
+    try:
+        result = _whisper_model.transcribe(audio.tensor[start:end], **options)
+    finally:
+        audio.close()
+    return _summarize(result)
+
+
+def _summarize(result):
+    summary = {
+        "text": result["text"],
+        "language": result.get("language"),
+        "segments": [
+            {"start": s["start"], "end": s["end"], "text": s["text"]}
+            for s in result["segments"]
+        ],
+    }
+    # Present when transcribe() ran with word_timestamps=True
+    if any("words" in s for s in result["segments"]):
+        summary["words"] = [
+            {"word": w["word"].strip(), "start": w["start"], "end": w["end"]}
+            for s in result["segments"] for w in s.get("words", [])
+        ]
+    return summary
+
+
+class InferencePool:
+    # partition is a (worker CPU sets, reserved CPUs) pair from partition_cpus; by default
+    # the CPUs are partitioned here, keeping web_cpu_reserve of them back for the web process
+    def __init__(self, num_workers=INFERENCE_WORKERS, model_name=WHISPER_MODEL, web_cpu_reserve=WEB_CPU_RESERVE,
+                 word_timestamps=WORD_TIMESTAMPS, partition=None):
+        # Options applied to every transcribe() call made by the workers
+        self.options = {"word_timestamps": True} if word_timestamps else {}
+        # Spawn rather than fork so workers never inherit the parent's torch thread state
+        context = multiprocessing.get_context("spawn")
+        cpu_sets, self.reserved_cpus = partition or partition_cpus(num_workers, web_cpu_reserve)
+        cpu_queue = context.Queue()
+        for cpus in cpu_sets:
+            cpu_queue.put(cpus)
+        self._loaded = context.Queue()
+
+        self.num_workers = len(cpu_sets)
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.num_workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(cpu_queue, model_name, self._loaded),
+        )
+
+    # The executor only starts its processes when work is submitted. Start every worker
+    # now and block until each has loaded the model; raises if a worker fails to start.
+    def wait_ready(self):
+        futures = [self._executor.submit(_ping) for _ in range(self.num_workers)]
+        loaded = 0
+        try:
+            while loaded < self.num_workers:
+                try:
+                    self._loaded.get(timeout=1)
+                    loaded += 1
+                except queue.Empty:
+                    for future in futures:
+                        if future.done() and future.exception() is not None:
+                            raise future.exception()
+        except BaseException:
+            self.shutdown(wait=False)
+            raise
+        return self
+
+    # Returns a Future so callers can run other stages while Whisper works
+    def submit_transcribe(self, audio, **options):
+        return self._executor.submit(_transcribe, audio, {**self.options, **options})
+
+    # Decode each (start, end) sample range on whichever worker is free and stitch them in order
+    def submit_spans(self, audio, spans, **options):
+        # Chunks are cut at pauses, so earlier text would only mislead the decoder
+        options = {"condition_on_previous_text": False, **self.options, **options}
+        futures = [self._executor.submit(_transcribe_span, audio, start, end, options) for start, end in spans]
+        return stitch_futures(futures, spans)
+
+    def transcribe(self, audio, **options):
+        return self.submit_transcribe(audio, **options).result()
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,121 @@
+import os
+import threading
+from concurrent.futures import Future
+import numpy as np
+from audio import SAMPLE_RATE, SharedAudio
+
+# "sequential" keeps Whisper's own sliding window; "vad" cuts the recording at pauses
+# and decodes the chunks in parallel
+LONGFORM_MODE = os.getenv("LONGFORM_MODE", "sequential")
+
+# Longest chunk handed to Whisper; it cannot see more than 30 s at once
+MAX_CHUNK_SECONDS = 30
+
+FRAME_MS = 30
+# Cuts go in the middle of the quietest stretch of this length, i.e. inside a pause
+PAUSE_MS = 300
+# Every chunk but the last is at least this long, so cuts never leave slivers
+MIN_CHUNK_SECONDS = 15
+# Frames measured at once by frame_energy_db (about 30 s of audio)
+ENERGY_BLOCK_FRAMES = 1000
+
+
+# Function to measure the energy of each FRAME_MS frame in dB. Frames are read
+# ENERGY_BLOCK_FRAMES at a time, so a memory-mapped recording is never copied whole.
+def frame_energy_db(samples, sample_rate=SAMPLE_RATE):
+    frame = sample_rate * FRAME_MS // 1000
+    n_frames = len(samples) // frame
+    energy = np.empty(n_frames, dtype=np.float64)
+    for first in range(0, n_frames, ENERGY_BLOCK_FRAMES):
+        last = min(first + ENERGY_BLOCK_FRAMES, n_frames)
+        frames = np.asarray(samples[first * frame:last * frame], dtype=np.float32).reshape(last - first, frame)
+        energy[first:last] = np.einsum("ij,ij->i", frames, frames, dtype=np.float64) / frame
+    return 10 * np.log10(energy + 1e-10)
+
+
+# Function to split a recording into consecutive chunks of at most max_seconds that
+# together cover all of it. The detector only chooses where to cut: each cut goes in
+# the quietest pause between MIN_CHUNK_SECONDS and max_seconds after the previous one,
+# so no audio is dropped however little silence the recording has.
+def plan_chunks(samples, sample_rate=SAMPLE_RATE, max_seconds=MAX_CHUNK_SECONDS):
+    total = len(samples)
+    limit = int(max_seconds * sample_rate)
+    if total <= limit:
+        return [(0, total)] if total else []
+
+    frame = sample_rate * FRAME_MS // 1000
+    width = max(1, PAUSE_MS // FRAME_MS)
+    # Mean energy of the width frames starting at each frame
+    pauses = np.convolve(frame_energy_db(samples, sample_rate), np.ones(width) / width, mode="valid")
+    min_length = int(min(MIN_CHUNK_SECONDS, max_seconds / 2) * sample_rate)
+
+    chunks = []
+    start = 0
+    while total - start > limit:
+        first = -(-(start + min_length) // frame)
+        last = (start + limit) // frame - width
+        if last < first:
+            cut = start + limit
+        else:
+            cut = (first + int(np.argmin(pauses[first:last + 1])) + width // 2) * frame
+        chunks.append((start, cut))
+        start = cut
+    chunks.append((start, total))
+    return chunks
+
+
+# Function to combine per-chunk Futures into one Future holding the stitched transcript.
+# Chunk results carry chunk-relative segments; they are moved onto the global timeline here.
+def stitch_futures(futures, spans, sample_rate=SAMPLE_RATE):
+    result = Future()
+    if not futures:
+        result.set_result({"text": "", "language": None, "segments": []})
+        return result
+
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def on_done(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        try:
+            result.set_result(_stitch([future.result() for future in futures], spans, sample_rate))
+        except Exception as e:
+            result.set_exception(e)
+
+    for future in futures:
+        future.add_done_callback(on_done)
+    return result
+
+
+# Function to transcribe a recording as independent VAD chunks on any backend with submit_spans
+def submit_longform(transcriber, audio):
+    samples = audio.array if isinstance(audio, SharedAudio) else np.asarray(audio, dtype=np.float32)
+    return transcriber.submit_spans(audio, plan_chunks(samples))
+
+
+def _stitch(chunks, spans, sample_rate):
+    texts = []
+    segments = []
+    words = []
+    language = None
+    for chunk, (start, stop) in zip(chunks, spans):
+        offset = start / sample_rate
+        language = language or chunk.get("language")
+        texts.append(chunk["text"].strip())
+        for segment in chunk["segments"]:
+            # The last segment of a chunk can be left open-ended by the decoder
+            end = segment["end"] if segment["end"] is not None else (stop - start) / sample_rate
+            segments.append({
+                "start": offset + segment["start"],
+                "end": offset + end,
+                "text": segment["text"],
+            })
+        for word in chunk.get("words", []):
+            words.append({"word": word["word"], "start": offset + word["start"], "end": offset + word["end"]})
+    result = {"text": " ".join(text for text in texts if text), "language": language, "segments": segments}
+    if any("words" in chunk for chunk in chunks):
+        result["words"] = words
+    return result
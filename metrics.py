@@ -0,0 +1,206 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+# Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds, from sub-10 ms alignment up to an hour-long recording's Whisper pass
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+# Bytes, from 64 KiB to the default 2 GiB upload limit
+SIZE_BUCKETS = tuple(64 * 1024 * 4 ** i for i in range(9))
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def _labels(self, values):
+        if len(values) != len(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}")
+        return tuple(str(value) for value in values)
+
+    def _format_labels(self, values, extra=()):
+        pairs = list(zip(self.label_names, values)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+# Cumulative-bucket histogram; observe() is a bisect and three additions under a lock
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, label_names=(), buckets=TIME_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+
+    def observe(self, value, *labels):
+        key = self._labels(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def _samples(self):
+        with self._lock:
+            series = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        for key, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                yield f"{self.name}_bucket{self._format_labels(key, [('le', le)])} {cumulative}"
+            yield f"{self.name}_sum{self._format_labels(key)} {total}"
+            yield f"{self.name}_count{self._format_labels(key)} {count}"
+
+
+# Gauge whose series are either set directly or read from a callback at scrape time
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, label_names=()):
+        super().__init__(name, documentation, label_names)
+        self._values = {}
+        self._functions = {}
+
+    def set(self, value, *labels):
+        key = self._labels(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, *labels):
+        key = self._labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, *labels):
+        self.inc(-amount, *labels)
+
+    def set_function(self, function, *labels):
+        key = self._labels(labels)
+        with self._lock:
+            self._functions[key] = function
+
+    def _samples(self):
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        for key, function in functions.items():
+            try:
+                values[key] = function()
+            except Exception:
+                continue
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{self._format_labels(key)} {value}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def histogram(self, name, documentation, label_names=(), buckets=TIME_BUCKETS):
+        return self._add(Histogram(name, documentation, label_names, buckets))
+
+    def gauge(self, name, documentation, label_names=()):
+        return self._add(Gauge(name, documentation, label_names))
+
+    def render(self):
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+
+REGISTRY = MetricsRegistry()
+
+UPLOAD_BYTES = REGISTRY.histogram(
+    "transcription_upload_bytes", "Size of uploaded audio files", ["frontend"], buckets=SIZE_BUCKETS
+)
+STAGE_SECONDS = REGISTRY.histogram(
+    "transcription_stage_seconds", "Time spent in each pipeline stage", ["stage"]
+)
+STAGE_IN_FLIGHT = REGISTRY.gauge(
+    "transcription_stage_in_flight", "Pipeline stages currently running", ["stage"]
+)
+REAL_TIME_FACTOR = REGISTRY.gauge(
+    "transcription_real_time_factor", "Processing time over audio duration for the last uncached run of each model", ["model"]
+)
+REQUESTS_IN_FLIGHT = REGISTRY.gauge(
+    "transcription_requests_in_flight", "Requests currently being processed", ["frontend"]
+)
+QUEUE_DEPTH = REGISTRY.gauge(
+    "transcription_queue_depth", "Work waiting to start", ["queue"]
+)
+
+
+# Context manager timing one pipeline stage. The duration goes to the stage histogram
+# and, when a timings dict is given, into it for the Server-Timing header.
+@contextmanager
+def stage_timer(stage, timings=None):
+    STAGE_IN_FLIGHT.inc(1, stage)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_IN_FLIGHT.dec(1, stage)
+        STAGE_SECONDS.observe(elapsed, stage)
+        if timings is not None:
+            timings[stage] = elapsed
+
+
+# Context manager counting a request as in flight for the given front end
+@contextmanager
+def in_flight(frontend):
+    REQUESTS_IN_FLIGHT.inc(1, frontend)
+    try:
+        yield
+    finally:
+        REQUESTS_IN_FLIGHT.dec(1, frontend)
+
+
+# Function to time a streamed response body. Rendering happens as the client reads it,
+# so only the time spent producing chunks is counted, not the time spent sending them.
+def timed_stream(chunks, stage="render"):
+    elapsed = 0.0
+    iterator = iter(chunks)
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                elapsed += time.perf_counter() - start
+            yield chunk
+    finally:
+        STAGE_SECONDS.observe(elapsed, stage)
+
+
+# Function to format stage timings as a Server-Timing header value
+def server_timing(timings):
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())
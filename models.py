@@ -0,0 +1,206 @@
+import os
+import gc
+import time
+import threading
+from contextlib import contextmanager
+import torch
+
+# Models unused for this many seconds are unloaded; 0 keeps them forever
+MODEL_IDLE_TTL = int(os.getenv("MODEL_IDLE_TTL", "1800"))
+
+# Resident bytes allowed for all loaded models; 0 means unlimited.
+# Idle models are evicted least recently used first to make room.
+MODEL_MEMORY_BUDGET = int(os.getenv("MODEL_MEMORY_BUDGET", "0"))
+
+UNLOADED = "unloaded"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+
+class _Entry:
+    def __init__(self, name, loader, unloader, size_bytes):
+        self.name = name
+        self.loader = loader
+        self.unloader = unloader
+        self.size_hint = size_bytes
+        self.size_bytes = 0
+        self.model = None
+        self.state = UNLOADED
+        self.error = None
+        self.refs = 0
+        self.last_used = 0.0
+        self.loaded = threading.Condition()
+
+
+# Loads each model on first use (or in a background warm-up), counts the callers
+# using it and unloads it once it has been idle past the TTL or its memory is needed
+class ModelRegistry:
+    def __init__(self, idle_ttl=MODEL_IDLE_TTL, memory_budget=MODEL_MEMORY_BUDGET):
+        self.idle_ttl = idle_ttl
+        self.memory_budget = memory_budget
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._reaper = None
+        self._warmup = None
+
+    # size_bytes is only a hint used before the first load; afterwards the
+    # model's parameters and buffers are measured
+    def register(self, name, loader, unloader=None, size_bytes=0):
+        self._entries[name] = _Entry(name, loader, unloader, size_bytes)
+
+    @contextmanager
+    def use(self, name):
+        model = self.acquire(name)
+        try:
+            yield model
+        finally:
+            self.release(name)
+
+    def acquire(self, name):
+        entry = self._entries[name]
+        with entry.loaded:
+            entry.refs += 1
+            try:
+                while entry.state == LOADING:
+                    entry.loaded.wait()
+                if entry.state != READY:
+                    self._load(entry)
+            except BaseException:
+                entry.refs -= 1
+                raise
+            entry.last_used = time.monotonic()
+            return entry.model
+
+    def release(self, name):
+        entry = self._entries[name]
+        with entry.loaded:
+            entry.refs -= 1
+            entry.last_used = time.monotonic()
+
+    # Load the given models (all of them by default) in a background thread
+    def warm_up(self, names=None):
+        def run():
+            for name in names or list(self._entries):
+                try:
+                    self.acquire(name)
+                except Exception:
+                    # The failure is recorded and reported by status()
+                    continue
+                self.release(name)
+        thread = threading.Thread(target=run, name="model-warmup", daemon=True)
+        thread.start()
+        self._warmup = thread
+        return thread
+
+    # True while the startup warm-up is still loading models
+    def warming_up(self):
+        return self._warmup is not None and self._warmup.is_alive()
+
+    def status(self):
+        return {
+            name: {
+                "state": entry.state,
+                "in_use": entry.refs,
+                "size_bytes": entry.size_bytes,
+                "error": entry.error,
+            }
+            for name, entry in self._entries.items()
+        }
+
+    def ready(self, name):
+        return self._entries[name].state == READY
+
+    def unload(self, name):
+        entry = self._entries[name]
+        with entry.loaded:
+            if entry.state == READY and entry.refs == 0:
+                self._unload(entry)
+
+    def shutdown(self):
+        for name in list(self._entries):
+            self.unload(name)
+
+    # Called with entry.loaded held; other callers wait on the condition meanwhile
+    def _load(self, entry):
+        self._make_room(entry)
+        entry.state = LOADING
+        entry.error = None
+        entry.loaded.release()
+        try:
+            model = entry.loader()
+        except Exception as e:
+            entry.loaded.acquire()
+            entry.state = FAILED
+            entry.error = str(e)
+            entry.loaded.notify_all()
+            raise
+        entry.loaded.acquire()
+        entry.model = model
+        entry.size_bytes = _estimate_bytes(model) or entry.size_hint
+        entry.state = READY
+        entry.loaded.notify_all()
+        self._start_reaper()
+
+    def _unload(self, entry):
+        model, entry.model = entry.model, None
+        entry.state = UNLOADED
+        entry.size_bytes = 0
+        if entry.unloader is not None:
+            entry.unloader(model)
+        del model
+        gc.collect()
+
+    # Evict idle models, least recently used first, until the new one fits the budget
+    def _make_room(self, incoming):
+        if not self.memory_budget:
+            return
+        needed = incoming.size_bytes or incoming.size_hint
+        with self._lock:
+            others = [e for e in self._entries.values() if e is not incoming and e.state == READY]
+        resident = sum(e.size_bytes for e in others)
+        for entry in sorted(others, key=lambda e: e.last_used):
+            if resident + needed <= self.memory_budget:
+                return
+            # Never block on another model's lock while holding ours
+            if entry.loaded.acquire(blocking=False):
+                try:
+                    if entry.state == READY and entry.refs == 0:
+                        resident -= entry.size_bytes
+                        self._unload(entry)
+                finally:
+                    entry.loaded.release()
+
+    def _start_reaper(self):
+        with self._lock:
+            if self._reaper is not None or not self.idle_ttl:
+                return
+            self._reaper = threading.Thread(target=self._reap, name="model-reaper", daemon=True)
+            self._reaper.start()
+
+    def _reap(self):
+        interval = max(1, min(60, self.idle_ttl / 4))
+        while True:
+            time.sleep(interval)
+            cutoff = time.monotonic() - self.idle_ttl
+            for entry in list(self._entries.values()):
+                with entry.loaded:
+                    if entry.state == READY and entry.refs == 0 and entry.last_used < cutoff:
+                        self._unload(entry)
+
+
+# Function to estimate the resident size of a model from the torch modules it holds
+def _estimate_bytes(model):
+    modules = []
+    candidates = [model, getattr(model, "model", None)] + list(getattr(model, "__dict__", {}).values())
+    for candidate in candidates:
+        if isinstance(candidate, torch.nn.Module):
+            modules.append(candidate)
+    seen = set()
+    total = 0
+    for module in modules:
+        for tensor in list(module.parameters()) + list(module.buffers()):
+            if id(tensor) not in seen:
+                seen.add(id(tensor))
+                total += tensor.numel() * tensor.element_size()
+    return total
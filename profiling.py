@@ -0,0 +1,165 @@
+import os
+import sys
+import time
+import uuid
+import pstats
+import cProfile
+import threading
+from collections import Counter
+
+# Profiling is unavailable unless this is set; a request flag is otherwise ignored
+PROFILING_ENABLED = os.getenv("PROFILING", "0") == "1"
+
+# Artifacts are written here and only the newest PROFILE_KEEP are kept
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+
+# Sampling period; at 10 ms the sampler thread costs about one stack walk per thread
+# 100 times a second
+PROFILE_INTERVAL_MS = int(os.getenv("PROFILE_INTERVAL_MS", "10"))
+
+# Longest process-wide sampling window the admin endpoint will start
+PROFILE_MAX_SECONDS = int(os.getenv("PROFILE_MAX_SECONDS", "300"))
+
+# Frames beyond this depth are dropped from a sample
+MAX_STACK_DEPTH = 128
+
+SAMPLE = "sample"
+CPROFILE = "cprofile"
+MODES = (SAMPLE, CPROFILE)
+
+# Only one profile runs at a time, so overhead never stacks up under load
+_active = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+# Samples the Python stacks of every thread in the process at a fixed interval and
+# counts them in collapsed form ("thread;outer;...;inner"), the input format of
+# flamegraph.pl and speedscope
+class StackSampler:
+    def __init__(self, interval_ms=PROFILE_INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self.counts = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.counts
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.counts[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+
+# Function to run func under the given profiler and store the artifact. Returns
+# (result, artifact name). Raises ProfilerBusy if another profile is running.
+def run_profiled(mode, func, *args):
+    if mode not in MODES:
+        raise ValueError(f"Unknown profiling mode: {mode}")
+    if not _active.acquire(blocking=False):
+        raise ProfilerBusy("Another profile is already running")
+    try:
+        if mode == CPROFILE:
+            # cProfile only sees the calling thread: time spent waiting on the Whisper
+            # and diarization workers shows up as future.result()
+            profiler = cProfile.Profile()
+            try:
+                result = profiler.runcall(func, *args)
+            finally:
+                name = _artifact_name("prof")
+                pstats.Stats(profiler).dump_stats(os.path.join(PROFILE_DIR, name))
+        else:
+            sampler = StackSampler().start()
+            try:
+                result = func(*args)
+            finally:
+                name = _save_collapsed(sampler.stop())
+    finally:
+        _active.release()
+    _prune()
+    return result, name
+
+
+# Function to sample the whole process for a number of seconds in the background.
+# Returns the name the artifact will be stored under.
+def start_process_sampling(seconds):
+    seconds = max(1, min(seconds, PROFILE_MAX_SECONDS))
+    name = _artifact_name("collapsed")
+    if not _active.acquire(blocking=False):
+        raise ProfilerBusy("Another profile is already running")
+
+    def run():
+        try:
+            sampler = StackSampler().start()
+            time.sleep(seconds)
+            _save_collapsed(sampler.stop(), name)
+        finally:
+            _active.release()
+        _prune()
+
+    threading.Thread(target=run, name="profile-window", daemon=True).start()
+    return name, seconds
+
+
+def busy():
+    return _active.locked()
+
+
+def list_artifacts():
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    return sorted(name for name in os.listdir(PROFILE_DIR) if not name.endswith(".tmp"))
+
+
+# Function to resolve an artifact name to its path, refusing anything outside PROFILE_DIR
+def artifact_path(name):
+    if os.path.basename(name) != name or name not in list_artifacts():
+        return None
+    return os.path.join(PROFILE_DIR, name)
+
+
+def _artifact_name(extension):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.{extension}"
+
+
+def _save_collapsed(counts, name=None):
+    name = name or _artifact_name("collapsed")
+    path = os.path.join(PROFILE_DIR, name)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        for stack, count in counts.most_common():
+            f.write(f"{stack} {count}\n")
+    os.replace(tmp_path, path)
+    return name
+
+
+def _prune():
+    names = list_artifacts()
+    for name in names[:max(0, len(names) - PROFILE_KEEP)]:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, name))
+        except FileNotFoundError:
+            pass
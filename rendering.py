@@ -0,0 +1,121 @@
+import os
+import json
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+
+# Template events buffered into each chunk sent to the client
+RENDER_BUFFER_EVENTS = int(os.getenv("RENDER_BUFFER_EVENTS", "64"))
+
+# Templates are compiled once at import; auto_reload would stat the file on every request
+_environment = Environment(
+    loader=FileSystemLoader(TEMPLATE_DIR),
+    autoescape=select_autoescape(["html"]),
+    auto_reload=False,
+)
+RESULT_TEMPLATE = _environment.get_template("result.html")
+
+NO_TEXT = "[No text found]"
+
+
+# Function to render the HTML report as a stream of chunks, one buffer of rows at a time
+def render_html(result):
+    stream = RESULT_TEMPLATE.stream(
+        transcription=result["transcription"],
+        sentiment=result["sentiment"],
+        speaker_sentiment=result.get("speaker_sentiment"),
+        diarization=result["diarization"],
+    )
+    stream.enable_buffering(RENDER_BUFFER_EVENTS)
+    return iter(stream)
+
+
+# Function to render the result as JSON, serializing one segment at a time so the whole
+# document is never held as a single string
+def render_json(result):
+    header = {key: value for key, value in result.items() if key != "diarization"}
+    yield json.dumps(header)[:-1] + (", " if header else "") + '"diarization": ['
+    for index, segment in enumerate(result["diarization"]):
+        yield ("," if index else "") + json.dumps(segment)
+    yield "]}"
+
+
+# Function to render the speaker turns as SubRip subtitles
+def render_srt(result):
+    for index, segment in enumerate(_cues(result), 1):
+        yield (
+            f"{index}\n"
+            f"{_timestamp(segment['start'], ',')} --> {_timestamp(segment['end'], ',')}\n"
+            f"{segment['speaker']}: {segment['text']}\n\n"
+        )
+
+
+# Function to render the speaker turns as WebVTT captions with voice spans
+def render_vtt(result):
+    yield "WEBVTT\n\n"
+    for segment in _cues(result):
+        speaker = segment['speaker'].replace(">", "")
+        text = segment['text'].replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+        yield (
+            f"{_timestamp(segment['start'], '.')} --> {_timestamp(segment['end'], '.')}\n"
+            f"<v {speaker}>{text}\n\n"
+        )
+
+
+def _cues(result):
+    return (segment for segment in result["diarization"] if segment['text'] != NO_TEXT)
+
+
+def _timestamp(seconds, separator):
+    millis = int(round(seconds * 1000))
+    hours, millis = divmod(millis, 3_600_000)
+    minutes, millis = divmod(millis, 60_000)
+    seconds, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}{separator}{millis:03d}"
+
+
+# Output formats by name, with their media type and renderer
+FORMATS = {
+    "html": ("text/html; charset=utf-8", render_html),
+    "json": ("application/json", render_json),
+    "srt": ("application/x-subrip; charset=utf-8", render_srt),
+    "vtt": ("text/vtt; charset=utf-8", render_vtt),
+}
+
+_MEDIA_TYPES = {
+    "text/html": "html",
+    "application/json": "json",
+    "application/x-subrip": "srt",
+    "text/srt": "srt",
+    "text/vtt": "vtt",
+}
+
+
+# Function to choose an output format. An explicit ?format= wins; otherwise the Accept
+# header's highest-weighted supported type is used, and HTML is the default.
+# Returns None when neither names a supported format.
+def negotiate(accept=None, requested=None):
+    if requested:
+        requested = requested.lower()
+        return requested if requested in FORMATS else None
+    if not accept:
+        return "html"
+
+    choices = []
+    for position, item in enumerate(accept.split(",")):
+        media_type, *params = [part.strip() for part in item.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if quality <= 0:
+            continue
+        media_type = media_type.lower()
+        if media_type in _MEDIA_TYPES:
+            choices.append((-quality, position, _MEDIA_TYPES[media_type]))
+        elif media_type in ("*/*", "text/*"):
+            choices.append((-quality, position, "html"))
+    return min(choices)[2] if choices else None
@@ -0,0 +1,84 @@
+import os
+import torch
+
+# Segments scored per forward pass
+SENTIMENT_BATCH_SIZE = int(os.getenv("SENTIMENT_BATCH_SIZE", "32"))
+
+# DistilBERT's positional limit; longer segments are scored in windows of this many
+# tokens (special tokens included)
+SENTIMENT_MAX_TOKENS = 512
+
+
+# Function to score every segment with a text-classification pipeline's model. Segments
+# are tokenized once and split into windows of at most SENTIMENT_MAX_TOKENS, so a long
+# monologue is scored in full rather than truncated. Windows are sorted by length and
+# padded only to the longest member of their batch, and a segment's probabilities are
+# the token-weighted mean over its windows.
+# Returns one {"label", "score", "probabilities"} per segment (None for empty text).
+def score_segments(sentiment_pipeline, texts, batch_size=SENTIMENT_BATCH_SIZE):
+    tokenizer = sentiment_pipeline.tokenizer
+    model = sentiment_pipeline.model
+    labels = [model.config.id2label[i] for i in range(model.config.num_labels)]
+
+    scored = [i for i, text in enumerate(texts) if text and text.strip()]
+    results = [None] * len(texts)
+    if not scored:
+        return results
+
+    size = SENTIMENT_MAX_TOKENS - tokenizer.num_special_tokens_to_add()
+    encoded = tokenizer([texts[i] for i in scored], add_special_tokens=False, verbose=False)["input_ids"]
+    # (segment, window input ids, tokens of text it covers)
+    windows = []
+    for i, token_ids in zip(scored, encoded):
+        for begin in range(0, max(len(token_ids), 1), size):
+            chunk = token_ids[begin:begin + size]
+            windows.append((i, tokenizer.build_inputs_with_special_tokens(chunk), max(len(chunk), 1)))
+
+    totals = {}
+    order = sorted(range(len(windows)), key=lambda k: len(windows[k][1]))
+    for begin in range(0, len(order), batch_size):
+        members = order[begin:begin + batch_size]
+        batch = tokenizer.pad({"input_ids": [windows[k][1] for k in members]}, return_tensors="pt")
+        with torch.inference_mode():
+            probabilities = model(**batch).logits.softmax(dim=-1)
+        for k, row in zip(members, probabilities.tolist()):
+            i, _, weight = windows[k]
+            total = totals.setdefault(i, [0.0] * len(labels))
+            for j, probability in enumerate(row):
+                total[j] += weight * probability
+
+    for i, total in totals.items():
+        weight = sum(total)
+        row = [value / weight for value in total]
+        best = max(range(len(row)), key=row.__getitem__)
+        results[i] = {
+            "label": labels[best],
+            "score": row[best],
+            "probabilities": dict(zip(labels, row)),
+        }
+    return results
+
+
+# Function to combine segment scores into one duration-weighted score per speaker and
+# one for the whole file. Returns (overall, per_speaker) in the pipeline's
+# {"label", "score"} shape.
+def aggregate_sentiment(segments, scores):
+    totals = {}
+    speaker_totals = {}
+    for segment, score in zip(segments, scores):
+        if score is None:
+            continue
+        weight = max(segment["end"] - segment["start"], 1e-3)
+        speaker = speaker_totals.setdefault(segment.get("speaker", "unknown"), {})
+        for label, probability in score["probabilities"].items():
+            totals[label] = totals.get(label, 0.0) + weight * probability
+            speaker[label] = speaker.get(label, 0.0) + weight * probability
+    return _summary(totals), {name: _summary(speaker) for name, speaker in speaker_totals.items()}
+
+
+def _summary(totals):
+    if not totals:
+        return {"label": "NEUTRAL", "score": 0.0}
+    weight = sum(totals.values())
+    label = max(totals, key=totals.get)
+    return {"label": label, "score": totals[label] / weight}
@@ -0,0 +1,193 @@
+import os
+import asyncio
+import subprocess
+import threading
+import numpy as np
+from audio import SAMPLE_RATE
+
+# New audio needed before the rolling buffer is decoded again
+STREAM_STEP_MS = int(os.getenv("STREAM_STEP_MS", "500"))
+
+# Segments ending closer than this to the live edge may still change
+STREAM_STABLE_MARGIN_MS = int(os.getenv("STREAM_STABLE_MARGIN_MS", "1000"))
+
+# Once the rolling buffer reaches this length everything but its last segment is finalized,
+# so it always fits in Whisper's 30 s window
+STREAM_MAX_BUFFER_SECONDS = int(os.getenv("STREAM_MAX_BUFFER_SECONDS", "25"))
+
+
+# Decodes an Opus (Ogg or WebM) byte stream to 16 kHz mono PCM through an ffmpeg pipe
+class _FfmpegDecoder:
+    def __init__(self, on_samples):
+        self._on_samples = on_samples
+        self._process = subprocess.Popen(
+            ["ffmpeg", "-nostdin", "-loglevel", "error", "-i", "pipe:0",
+             "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        )
+        self._reader = threading.Thread(target=self._read, name="stream-decoder", daemon=True)
+        self._reader.start()
+
+    def write(self, data):
+        self._process.stdin.write(data)
+        self._process.stdin.flush()
+
+    # Close ffmpeg's input and wait until all decoded audio has been delivered
+    def flush(self):
+        self._process.stdin.close()
+        self._reader.join()
+        self._process.wait()
+
+    def close(self):
+        if self._process.poll() is None:
+            self._process.kill()
+        self._reader.join()
+
+    def _read(self):
+        pending = b""
+        while True:
+            data = self._process.stdout.read1(8192)
+            if not data:
+                return
+            data = pending + data
+            usable = len(data) - len(data) % 2
+            pending = data[usable:]
+            self._on_samples(_pcm_to_float(data[:usable]))
+
+
+def _pcm_to_float(data):
+    return np.frombuffer(data, dtype=np.int16).astype(np.float32) / 32768.0
+
+
+# One live stream: accumulates audio, re-decodes a rolling buffer and turns the
+# hypotheses into partial and final segments with timestamps on the stream's timeline.
+# A segment becomes final once two consecutive decodes agree on it and it is no
+# longer near the live edge; final audio is then dropped from the buffer. If slot is
+# given, it is called for a context manager that is held for the length of each decode.
+class StreamingSession:
+    def __init__(self, submit_transcribe, audio_format="pcm", slot=None):
+        self._submit = submit_transcribe
+        self._slot = slot
+        self._lock = threading.Lock()
+        self._buffer = np.zeros(0, dtype=np.float32)
+        self._buffer_start = 0.0
+        self._new_samples = 0
+        self._previous = []
+        self._pending = b""
+        self._audio_ready = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        self._decoder = _FfmpegDecoder(self._append_threadsafe) if audio_format == "opus" else None
+
+    # Accept one frame from the client: raw s16le 16 kHz mono PCM, or a piece of an Opus
+    # stream. The pipe write to ffmpeg can block, so it runs off the event loop.
+    async def feed(self, data):
+        if self._decoder is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self._decoder.write, data)
+        else:
+            # A frame may end mid-sample; carry the odd byte over to the next frame
+            data = self._pending + data
+            usable = len(data) - len(data) % 2
+            self._pending = data[usable:]
+            self._append(_pcm_to_float(data[:usable]))
+
+    # Wait for enough new audio, decode the buffer and return the resulting events
+    async def step(self):
+        step_samples = SAMPLE_RATE * STREAM_STEP_MS // 1000
+        while True:
+            with self._lock:
+                if self._new_samples >= step_samples:
+                    break
+                self._audio_ready.clear()
+            await self._audio_ready.wait()
+        return await self._decode(final=False)
+
+    # End of stream: decode whatever is left and finalize all of it
+    async def finish(self):
+        if self._decoder is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self._decoder.flush)
+        return await self._decode(final=True)
+
+    def close(self):
+        if self._decoder is not None:
+            self._decoder.close()
+
+    # Waiting for the slot blocks, so it happens off the event loop. The slot is given
+    # back when the decode finishes, even if the caller stopped waiting for it.
+    async def _transcribe(self, buffer):
+        if self._slot is None:
+            return await asyncio.wrap_future(self._submit(buffer))
+        slot = self._slot()
+        entering = asyncio.get_running_loop().run_in_executor(None, slot.__enter__)
+        try:
+            await asyncio.shield(entering)
+        except asyncio.CancelledError:
+            entering.add_done_callback(
+                lambda done: done.cancelled() or done.exception() is not None or slot.__exit__(None, None, None)
+            )
+            raise
+        try:
+            future = self._submit(buffer)
+        except BaseException:
+            slot.__exit__(None, None, None)
+            raise
+        future.add_done_callback(lambda _: slot.__exit__(None, None, None))
+        return await asyncio.wrap_future(future)
+
+    def _append_threadsafe(self, samples):
+        self._loop.call_soon_threadsafe(self._append, samples)
+
+    def _append(self, samples):
+        with self._lock:
+            self._buffer = np.concatenate((self._buffer, samples))
+            self._new_samples += len(samples)
+        self._audio_ready.set()
+
+    async def _decode(self, final):
+        with self._lock:
+            buffer = self._buffer.copy()
+            buffer_start = self._buffer_start
+            self._new_samples = 0
+        if not len(buffer):
+            return []
+
+        result = await self._transcribe(buffer)
+        segments = [s for s in result["segments"] if s["text"].strip()]
+        duration = len(buffer) / SAMPLE_RATE
+
+        if final:
+            stable = len(segments)
+        else:
+            stable = 0
+            live_edge = duration - STREAM_STABLE_MARGIN_MS / 1000
+            while (stable < len(segments) and stable < len(self._previous)
+                   and segments[stable]["end"] <= live_edge
+                   and segments[stable]["text"].strip() == self._previous[stable]["text"].strip()):
+                stable += 1
+            if duration >= STREAM_MAX_BUFFER_SECONDS:
+                stable = max(stable, len(segments) - 1) or len(segments)
+
+        events = [_event("final", segment, buffer_start) for segment in segments[:stable]]
+        events += [_event("partial", segment, buffer_start) for segment in segments[stable:]]
+        self._previous = segments[stable:]
+
+        cut = 0
+        if stable:
+            # Drop the finalized audio so the buffer stays short
+            cut = min(int(segments[stable - 1]["end"] * SAMPLE_RATE), len(buffer))
+        elif not segments and duration >= STREAM_MAX_BUFFER_SECONDS:
+            # Nothing but silence so far; there is nothing to keep
+            cut = len(buffer)
+        if cut:
+            with self._lock:
+                self._buffer = self._buffer[cut:]
+                self._buffer_start += cut / SAMPLE_RATE
+        return events
+
+
+def _event(kind, segment, offset):
+    return {
+        "type": kind,
+        "start": round(offset + segment["start"], 3),
+        "end": round(offset + segment["end"], 3),
+        "text": segment["text"].strip(),
+    }
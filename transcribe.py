@@ -1,37 +1,166 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, File, UploadFile, HTTPException, Request, WebSocket, WebSocketDisconnect
+from starlette.datastructures import Headers
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from transformers import pipeline
 from pyannote.audio import Pipeline
 import os
+import json
+import time
+import asyncio
 import torch
-import torchaudio
-from io import BytesIO
-import whisper
-import html
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor, wait
 from dotenv import load_dotenv
+from jobs import JobManager
+from inference_workers import InferencePool, WHISPER_MODEL, INFERENCE_WORKERS, WEB_CPU_RESERVE, partition_cpus, pin_process
+from batching import WhisperBatcher, BATCH_MAX_SIZE
+from hf_whisper import WHISPER_DIR, WHISPER_PRECISION
+from longform import LONGFORM_MODE, submit_longform
+from streaming import StreamingSession, STREAM_MAX_BUFFER_SECONDS
+from audio import SAMPLE_RATE, decode_audio, probe_duration
+from cache import ArtifactCache, audio_hash, text_hash
+from uploads import MAX_UPLOAD_BYTES, UploadTooLarge, upload_path, original_filename, save_async_stream
+from models import ModelRegistry, FAILED
+from alignment import align_segments
+from word_timestamps import WORD_TIMESTAMPS
+from sentiment import score_segments, aggregate_sentiment
+from rendering import FORMATS, negotiate, render_html
+import metrics
+from metrics import stage_timer, in_flight, timed_stream, server_timing
+import profiling
+from transcripts import TRANSCRIPT_STORE, InvalidQuery, save_transcript, search_segments, get_transcript
+from admission import AdmissionController, Overloaded
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Rejects request bodies over MAX_UPLOAD_BYTES while they are still arriving,
+# before the multipart parser has spooled the whole upload
+class MaxUploadSizeMiddleware:
+    def __init__(self, app, max_bytes=MAX_UPLOAD_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.max_bytes:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = Headers(scope=scope).get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+            response = JSONResponse({"detail": str(UploadTooLarge(self.max_bytes))}, status_code=413)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise HTTPException(status_code=413, detail=str(UploadTooLarge(self.max_bytes)))
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+# Answers 429 for admission-controlled paths while the queue is full, before any of
+# the request body is read
+class AdmissionCheckMiddleware:
+    def __init__(self, app, paths=("/transcribe", "/jobs")):
+        self.app = app
+        self.paths = paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["method"] == "POST" and scope["path"] in self.paths:
+            try:
+                admission.check()
+            except Overloaded as e:
+                response = JSONResponse(
+                    {"detail": str(e)}, status_code=429, headers={"Retry-After": str(e.retry_after)}
+                )
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
 # Initialize FastAPI app
 app = FastAPI()
+app.add_middleware(MaxUploadSizeMiddleware)
+app.add_middleware(AdmissionCheckMiddleware)
+
+# Pre-trained pipelines are loaded on first use (or by the startup warm-up) through the
+# registry, which also unloads them when idle; importing this module loads nothing
+DIARIZATION_MODEL = "pyannote/speaker-diarization"
+SENTIMENT_MODEL = "distilbert/distilbert-base-uncased-finetuned-sst-2-english"
+model_registry = ModelRegistry()
 
-# Load pre-trained pipelines
-diarization_pipeline = Pipeline.from_pretrained("pyannote/speaker-diarization", use_auth_token=os.getenv("HF_AUTH_TOKEN"))
-sentiment_pipeline = pipeline("sentiment-analysis", model="distilbert/distilbert-base-uncased-finetuned-sst-2-english")
-
-# Load Whisper model
-whisper_model = whisper.load_model("large-v2")  # Change to "large-v3" if necessary
-
-# Function to perform diarization
-def diarize_audio(file_path):
-    # Load audio file ensuring it is seekable
-    waveform, sample_rate = torchaudio.load(file_path)
-    temp_buffer = BytesIO()
-    torchaudio.save(temp_buffer, waveform, sample_rate, format="wav")
-    temp_buffer.seek(0)
-    
-    diarization_result = diarization_pipeline(temp_buffer)
+# Per-stage results keyed by the decoded audio, so resubmitted recordings skip inference
+artifact_cache = ArtifactCache()
+
+# "openai" runs Whisper large-v2 in a pool of worker processes, each with its own model and
+# CPU set; "hf-batched" runs the ./whisper checkpoint here with cross-request batching
+WHISPER_BACKEND = os.getenv("WHISPER_BACKEND", "openai")
+if WHISPER_BACKEND == "hf-batched":
+    whisper_fingerprint = {"backend": WHISPER_BACKEND, "model": WHISPER_DIR, "precision": WHISPER_PRECISION}
+else:
+    whisper_fingerprint = {"model": WHISPER_MODEL}
+whisper_fingerprint["longform"] = LONGFORM_MODE
+whisper_fingerprint["word_timestamps"] = WORD_TIMESTAMPS
+
+# CPUs are split once, at import on the main thread. Diarization and sentiment run in this
+# process on the CPUs the inference workers leave free; pinning here covers every thread,
+# and a pool reloaded after an idle unload reuses the same split.
+if WHISPER_BACKEND == "hf-batched":
+    cpu_partition = None
+else:
+    cpu_partition = partition_cpus(INFERENCE_WORKERS, WEB_CPU_RESERVE)
+    if cpu_partition[1]:
+        pin_process(cpu_partition[1])
+        torch.set_num_threads(len(cpu_partition[1]))
+
+# The model only counts as ready once every inference worker has loaded Whisper
+def load_transcriber():
+    if WHISPER_BACKEND == "hf-batched":
+        return WhisperBatcher(cache=artifact_cache)
+    return InferencePool(partition=cpu_partition).wait_ready()
+
+model_registry.register(
+    "whisper", load_transcriber, unloader=lambda transcriber: transcriber.shutdown(wait=False),
+    size_bytes=int(os.getenv("WHISPER_SIZE_HINT", str(3 * 1024 ** 3)))
+)
+model_registry.register(
+    "diarization",
+    lambda: Pipeline.from_pretrained(DIARIZATION_MODEL, use_auth_token=os.getenv("HF_AUTH_TOKEN"))
+)
+model_registry.register("sentiment", lambda: pipeline("sentiment-analysis", model=SENTIMENT_MODEL))
+
+# Diarization gets its own threads so it overlaps with Whisper instead of waiting for it
+DIARIZATION_WORKERS = int(os.getenv("DIARIZATION_WORKERS", "1"))
+diarization_executor = ThreadPoolExecutor(max_workers=DIARIZATION_WORKERS, thread_name_prefix="diarize")
+
+# Requests each model serves at once. The Whisper default matches the backend: one per
+# inference worker, or one batch's worth of requests for hf-batched.
+admission = AdmissionController({
+    "whisper": int(os.getenv("WHISPER_CONCURRENCY", str(BATCH_MAX_SIZE if WHISPER_BACKEND == "hf-batched" else INFERENCE_WORKERS))),
+    "diarization": int(os.getenv("DIARIZATION_CONCURRENCY", str(DIARIZATION_WORKERS))),
+    "sentiment": int(os.getenv("SENTIMENT_CONCURRENCY", "1")),
+})
+metrics.QUEUE_DEPTH.set_function(lambda: admission.status()["admitted"], "admitted")
+for resource_name in admission.limits:
+    metrics.QUEUE_DEPTH.set_function(lambda name=resource_name: admission.status()["waiting"][name], resource_name)
+
+# Background workers for queued transcription jobs
+job_manager = JobManager()
+metrics.QUEUE_DEPTH.set_function(lambda: job_manager.counts()["queued"], "jobs")
+metrics.REQUESTS_IN_FLIGHT.set_function(lambda: job_manager.counts()["running"], "jobs")
+
+# Function to perform diarization on a decoded 16 kHz mono waveform
+def diarize_audio(waveform):
+    # pyannote takes in-memory audio as a (channel, time) tensor; unsqueeze is a view, not a copy
+    with model_registry.use("diarization") as diarization_pipeline:
+        diarization_result = diarization_pipeline({"waveform": waveform.unsqueeze(0), "sample_rate": SAMPLE_RATE})
     segments = []
     for segment in diarization_result.itersegments():
         try:
@@ -59,110 +188,377 @@ def identify_speaker_names(transcription, diarization):
 
 # Function to update diarization segments with speaker names
 def update_diarization_with_names(diarization, speaker_names, transcription_segments):
+    # Assign text to each segment with a single sweep over both timelines
+    pieces = align_segments(diarization, transcription_segments)
     updated_diarization = []
-    for segment in diarization:
+    for segment, segment_text in zip(diarization, pieces):
         speaker = segment['speaker']
         if speaker in speaker_names:
             segment['speaker'] = speaker_names[speaker]
-        
-        # Assign text to each segment
-        segment_text = []
-        for trans_segment in transcription_segments:
-            if trans_segment['start'] >= segment['start'] and trans_segment['start'] < segment['end']:
-                segment_text.append(trans_segment['text'])
         segment['text'] = ' '.join(segment_text).strip() or "[No text found]"
         updated_diarization.append(segment)
     return updated_diarization
 
-# Function to generate HTML response
+# Function to generate the HTML report as one string; the endpoints stream it instead
 def generate_html(transcription, sentiment, diarization):
-    html_content = f"""
-    <!doctype html>
-    <html lang="en">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>Transcription Results</title>
-    </head>
-    <body>
-        <h1>Transcription Results</h1>
-        <h2>Transcription</h2>
-        <p>{html.escape(transcription)}</p>
-        <h2>Sentiment</h2>
-        <p>Label: {html.escape(sentiment['label'])}</p>
-        <p>Score: {sentiment['score']:.2f}</p>
-        <h2>Diarization</h2>
-        <table border="1">
-            <thead>
-                <tr>
-                    <th>Start</th>
-                    <th>End</th>
-                    <th>Speaker</th>
-                    <th>Text</th>
-                </tr>
-            </thead>
-            <tbody>
-    """
-    for entry in diarization:
-        html_content += f"""
-                <tr>
-                    <td>{entry['start']:.2f}</td>
-                    <td>{entry['end']:.2f}</td>
-                    <td>{html.escape(entry['speaker'])}</td>
-                    <td>{html.escape(entry['text'])}</td>
-                </tr>
-        """
-    html_content += """
-            </tbody>
-        </table>
-    </body>
-    </html>
-    """
-    return html_content
+    return "".join(render_html({"transcription": transcription, "sentiment": sentiment, "diarization": diarization}))
 
-@app.post("/transcribe", response_class=HTMLResponse)
-async def transcribe(file: UploadFile = File(...)):
-    file_path = os.path.join("uploads", file.filename)
-    try:
-        with open(file_path, "wb") as f:
-            f.write(await file.read())
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
+# Function to start Whisper on a decoded recording, either as one long-form pass
+# or as VAD chunks decoded in parallel
+def submit_transcription(transcriber, audio):
+    if LONGFORM_MODE == "vad":
+        return submit_longform(transcriber, audio)
+    return transcriber.submit_transcribe(audio)
+
+# Function to score the sentiment of each aligned segment in batches and combine the
+# scores per speaker and for the whole file
+def analyze_sentiment(segments):
+    texts = [segment['text'] if segment['text'] != "[No text found]" else "" for segment in segments]
+    with model_registry.use("sentiment") as sentiment_pipeline:
+        scores = score_segments(sentiment_pipeline, texts)
+    overall, speakers = aggregate_sentiment(segments, scores)
+    return {
+        "overall": overall,
+        "speakers": speakers,
+        "segments": [None if score is None else {"label": score["label"], "score": score["score"]} for score in scores],
+    }
+
+# Function to run the full transcription pipeline on a saved audio file. When a timings
+# dict is given, each stage's duration in seconds is recorded in it; cache defaults to
+# the shared artifact cache. With store, the result is saved to the transcript store.
+def process_audio(file_path, timings=None, cache=None, store=TRANSCRIPT_STORE):
+    # Decode the upload once; every stage below reads the same shared buffer
+    with stage_timer("decode", timings):
+        audio = decode_audio(file_path)
+    with audio:
+        source = original_filename(file_path) if store else None
+        return process_decoded_audio(audio, timings, cache, source)
 
+# Function to run diarization as a timed stage on the diarization executor
+def timed_diarization(waveform, duration, timings=None):
+    with admission.resource("diarization"), stage_timer("diarization", timings):
+        start = time.perf_counter()
+        segments = diarize_audio(waveform)
+    metrics.REAL_TIME_FACTOR.set((time.perf_counter() - start) / max(duration, 1e-3), "diarization")
+    return segments
+
+def process_decoded_audio(audio, timings=None, cache=None, source=None):
+    cache = cache or artifact_cache
+    digest = audio_hash(audio)
+    duration = max(audio.duration, 1e-3)
+
+    # Transcription and diarization are independent until alignment, so start both at once
+    diarization_future = cache.submit_or_get(
+        digest, "diarization", {"model": DIARIZATION_MODEL},
+        lambda: diarization_executor.submit(timed_diarization, audio.tensor, duration, timings)
+    )
     try:
-        # Perform transcription using Whisper
-        transcription_result = whisper_model.transcribe(file_path)
+        # Hold the Whisper backend until its work is done so it cannot be unloaded mid-request
+        with admission.resource("whisper"), stage_timer("whisper", timings), \
+                model_registry.use("whisper") as transcriber:
+            start = time.perf_counter()
+            transcription_future = cache.submit_or_get(
+                digest, "transcription", whisper_fingerprint,
+                lambda: submit_transcription(transcriber, audio)
+            )
+            cached = transcription_future.done()
+            transcription_result = transcription_future.result()
+            if not cached:
+                metrics.REAL_TIME_FACTOR.set((time.perf_counter() - start) / duration, "whisper")
         transcription = transcription_result['text']
 
-        # Extract segments from transcription
+        # Extract segments from transcription; with word timestamps each word is aligned
+        # to a speaker on its own
         transcription_segments = []
-        for segment in transcription_result['segments']:
-            transcription_segments.append({
-                'start': segment['start'],
-                'end': segment['end'],
-                'text': segment['text']
-            })
-
-        # Perform sentiment analysis
-        sentiment_result = sentiment_pipeline(transcription)[0]
+        if 'words' in transcription_result:
+            for word in transcription_result['words']:
+                transcription_segments.append({
+                    'start': word['start'],
+                    'end': word['end'],
+                    'text': word['word']
+                })
+        else:
+            for segment in transcription_result['segments']:
+                transcription_segments.append({
+                    'start': segment['start'],
+                    'end': segment['end'],
+                    'text': segment['text']
+                })
+    finally:
+        # Diarization reads the shared buffer, so it must finish before the caller frees it
+        wait([diarization_future])
 
-        # Perform diarization
-        diarization_segments = diarize_audio(file_path)
+    # Join the diarization stage before alignment
+    diarization_segments = diarization_future.result()
 
-        # Identify and update speaker names
+    # Identify and update speaker names
+    with stage_timer("alignment", timings):
         speaker_names = identify_speaker_names(transcription, diarization_segments)
         updated_diarization = update_diarization_with_names(diarization_segments, speaker_names, transcription_segments)
 
-        # Generate HTML response
-        html_response = generate_html(transcription, sentiment_result, updated_diarization)
+    # Perform sentiment analysis per aligned segment
+    def compute_sentiment():
+        with admission.resource("sentiment"):
+            start = time.perf_counter()
+            sentiment = analyze_sentiment(updated_diarization)
+        metrics.REAL_TIME_FACTOR.set((time.perf_counter() - start) / duration, "sentiment")
+        return sentiment
+
+    segment_key = json.dumps([(s['speaker'], s['start'], s['end'], s['text']) for s in updated_diarization])
+    with stage_timer("sentiment", timings):
+        sentiment_result = cache.get_or_compute(
+            digest, "sentiment", {"model": SENTIMENT_MODEL, "segments": text_hash(segment_key)},
+            compute_sentiment
+        )
+    for segment, segment_sentiment in zip(updated_diarization, sentiment_result["segments"]):
+        segment['sentiment'] = segment_sentiment
+
+    result = {
+        "transcription": transcription,
+        "sentiment": sentiment_result["overall"],
+        "speaker_sentiment": sentiment_result["speakers"],
+        "diarization": updated_diarization
+    }
+
+    # Keep the result searchable after the upload is deleted
+    if source is not None:
+        with stage_timer("store", timings):
+            result["transcript_id"] = save_transcript(digest, audio.duration, result, source)
+    return result
+
+# Function used by the Flask front end, which only shows the transcription text
+def transcribe_audio(file_path, timings=None):
+    return process_audio(file_path, timings)["transcription"]
+
+# Function to stream an upload to disk in bounded chunks under a unique name
+async def save_upload(file):
+    file_path = upload_path(file.filename)
+    try:
+        await save_async_stream(file, file_path)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to process audio: {str(e)}")
-    finally:
+        raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
+    metrics.UPLOAD_BYTES.observe(os.path.getsize(file_path), "api")
+    return file_path
+
+def remove_upload(file_path):
+    if os.path.exists(file_path):
         os.remove(file_path)
 
-    return html_response
+# Function to run the pipeline under the profiler requested with ?profile= or X-Profile
+# ("sample" or "cprofile"). Returns (result, response headers); without PROFILING=1 the
+# flag is ignored, and a request arriving while another profile runs is not profiled.
+def process_audio_profiled(file_path, timings, mode):
+    if not mode or not profiling.PROFILING_ENABLED:
+        return process_audio(file_path, timings), {}
+    try:
+        result, artifact = profiling.run_profiled(mode, process_audio, file_path, timings)
+    except profiling.ProfilerBusy:
+        return process_audio(file_path, timings), {"X-Profile": "busy"}
+    return result, {"X-Profile-Artifact": artifact}
+
+# The response format follows ?format=html|json|srt|vtt, or else the Accept header
+@app.post("/transcribe", response_class=HTMLResponse)
+async def transcribe(request: Request, file: UploadFile = File(...), format: str = None, profile: str = None):
+    output_format = negotiate(request.headers.get("accept"), format)
+    if output_format is None:
+        raise HTTPException(status_code=406, detail=f"Supported formats: {', '.join(FORMATS)}")
+    media_type, renderer = FORMATS[output_format]
+    profile = profile or request.headers.get("x-profile")
+    if profile and profile not in profiling.MODES:
+        raise HTTPException(status_code=400, detail=f"Profiling modes: {', '.join(profiling.MODES)}")
+
+    with in_flight("api"):
+        timings = {}
+        with stage_timer("upload", timings):
+            file_path = await save_upload(file)
+
+        try:
+            # Admit the request only if its estimated memory fits next to the admitted ones
+            with admission.admit(await run_in_threadpool(probe_duration, file_path)):
+                # Run the blocking pipeline off the event loop so other clients are still served
+                result, headers = await run_in_threadpool(process_audio_profiled, file_path, timings, profile)
+        except Overloaded as e:
+            raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to process audio: {str(e)}")
+        finally:
+            remove_upload(file_path)
+
+    # Rows are rendered and sent as they are produced rather than built into one string;
+    # render time therefore only reaches /metrics, not the Server-Timing header
+    return StreamingResponse(
+        timed_stream(renderer(result)), media_type=media_type,
+        headers={"Server-Timing": server_timing(timings), **headers}
+    )
+
+# A job is admitted like a /transcribe request and keeps its reservation while it is
+# queued and running, so the job queue is bounded and counted in the memory budget
+@app.post("/jobs", status_code=202)
+async def create_job(file: UploadFile = File(...)):
+    file_path = await save_upload(file)
+    cleanup = ExitStack()
+    cleanup.callback(remove_upload, file_path)
+    try:
+        cleanup.enter_context(admission.admit(await run_in_threadpool(probe_duration, file_path)))
+    except Overloaded as e:
+        cleanup.close()
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    try:
+        job_id = job_manager.submit(process_audio, file_path, cleanup=cleanup.close)
+    except BaseException:
+        cleanup.close()
+        raise
+    return {"job_id": job_id, "status": job_manager.get(job_id)["status"]}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JSONResponse(job)
+
+# Live transcription: the client sends binary frames (s16le 16 kHz mono PCM, or an
+# Opus stream with ?format=opus) and a text "end" message when the recording stops.
+# The server answers with partial and final segments as they stabilize. A stream is
+# admitted for as long as it stays open, sized by its longest rolling buffer; when the
+# server is full it gets an error with retry_after and close code 1013 (try again later).
+@app.websocket("/ws/transcribe")
+async def transcribe_stream(websocket: WebSocket):
+    await websocket.accept()
+    try:
+        with admission.admit(STREAM_MAX_BUFFER_SECONDS, timed=False):
+            await stream_session(websocket)
+    except Overloaded as e:
+        await websocket.send_text(json.dumps({"type": "error", "detail": str(e), "retry_after": e.retry_after}))
+        await websocket.close(code=1013)
+
+async def stream_session(websocket):
+    transcriber = await run_in_threadpool(model_registry.acquire, "whisper")
+    # Each decode waits for a Whisper slot like any other request
+    session = StreamingSession(
+        transcriber.submit_transcribe, websocket.query_params.get("format", "pcm"),
+        slot=lambda: admission.resource("whisper"),
+    )
+
+    async def send_events(events):
+        for event in events:
+            await websocket.send_text(json.dumps(event))
+
+    # Tell the client why the stream stopped instead of leaving the socket open and silent
+    async def fail(e):
+        await websocket.send_text(json.dumps({"type": "error", "detail": f"Transcription failed: {str(e)}"}))
+        await websocket.close(code=1011)
+
+    async def decode_loop():
+        try:
+            while True:
+                await send_events(await session.step())
+        except Exception as e:
+            await fail(e)
+
+    decoder = asyncio.create_task(decode_loop())
+    try:
+        while True:
+            message = await websocket.receive()
+            if decoder.done():
+                # The decode loop failed and has already closed the socket
+                return
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            if message.get("bytes"):
+                await session.feed(message["bytes"])
+            elif message.get("text") == "end":
+                break
+        decoder.cancel()
+        try:
+            events = await session.finish()
+        except Exception as e:
+            await fail(e)
+            return
+        await send_events(events)
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        decoder.cancel()
+        session.close()
+        model_registry.release("whisper")
+
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+# Full-text search over stored segments; every word must match, "phrases" match in
+# order and a trailing * matches a prefix
+@app.get("/search")
+def search(q: str, limit: int = 20, speaker: str = None, transcript_id: int = None):
+    try:
+        results = search_segments(q, limit, speaker, transcript_id)
+    except InvalidQuery as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"query": q, "results": results}
+
+@app.get("/transcripts/{transcript_id}")
+def read_transcript(transcript_id: int):
+    transcript = get_transcript(transcript_id)
+    if transcript is None:
+        raise HTTPException(status_code=404, detail="Transcript not found")
+    return transcript
+
+def require_profiling():
+    if not profiling.PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+
+# Sample every thread in the process for the given number of seconds
+@app.post("/admin/profile", status_code=202)
+async def start_profile(seconds: int = 30):
+    require_profiling()
+    try:
+        artifact, seconds = profiling.start_process_sampling(seconds)
+    except profiling.ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"artifact": artifact, "seconds": seconds}
+
+@app.get("/admin/profiles")
+async def list_profiles():
+    require_profiling()
+    return {"profiles": profiling.list_artifacts(), "running": profiling.busy()}
+
+@app.get("/admin/profiles/{name}")
+async def get_profile(name: str):
+    require_profiling()
+    path = profiling.artifact_path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, filename=name)
+
+# Readiness of each model; answers immediately even while models are still loading
+@app.get("/health")
+async def health():
+    models = model_registry.status()
+    # Unloaded models are loaded on demand, so only a failed load or the startup
+    # warm-up keeps the server from being ready
+    if any(model["state"] == FAILED for model in models.values()):
+        status = "degraded"
+    elif model_registry.warming_up():
+        status = "starting"
+    else:
+        status = "ready"
+    return {"status": status, "models": models, "admission": admission.status()}
+
+@app.on_event("startup")
+def warm_up_models():
+    if os.getenv("MODEL_WARMUP", "1") == "1":
+        model_registry.warm_up()
+
+@app.on_event("shutdown")
+def shutdown_workers():
+    job_manager.shutdown(wait=False)
+    diarization_executor.shutdown(wait=False)
+    model_registry.shutdown()
 
 if __name__ == '__main__':
-    os.makedirs("uploads", exist_ok=True)
     import uvicorn
     uvicorn.run(app, host="127.0.0.1", port=8000)
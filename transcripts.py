@@ -0,0 +1,237 @@
+import os
+import re
+import time
+from database import DB_PATH, get_pool
+
+# Transcripts live in their own file next to speakers.db
+TRANSCRIPTS_DB_PATH = os.getenv(
+    "TRANSCRIPTS_DB_PATH", os.path.join(os.path.dirname(DB_PATH), "transcripts.db")
+)
+
+# Store every processed recording; set to 0 to keep results only in the response
+TRANSCRIPT_STORE = os.getenv("TRANSCRIPT_STORE", "1") == "1"
+
+# Largest number of hits a search may return
+MAX_SEARCH_RESULTS = 1000
+
+NO_TEXT = "[No text found]"
+
+# Segment times are stored in integer milliseconds. segments_fts is an external-content
+# FTS5 index over segments.text kept in sync by triggers, so the text is stored once.
+_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS transcripts (
+        id INTEGER PRIMARY KEY,
+        audio_hash TEXT NOT NULL UNIQUE,
+        source TEXT,
+        duration REAL,
+        text TEXT,
+        sentiment_label TEXT,
+        sentiment_score REAL,
+        created_at REAL
+    )""",
+    """CREATE TABLE IF NOT EXISTS transcript_speakers (
+        transcript_id INTEGER NOT NULL REFERENCES transcripts(id),
+        speaker TEXT NOT NULL,
+        sentiment_label TEXT,
+        sentiment_score REAL,
+        PRIMARY KEY (transcript_id, speaker)
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS segments (
+        id INTEGER PRIMARY KEY,
+        transcript_id INTEGER NOT NULL REFERENCES transcripts(id),
+        start_ms INTEGER NOT NULL,
+        end_ms INTEGER NOT NULL,
+        speaker TEXT,
+        text TEXT NOT NULL,
+        sentiment_label TEXT,
+        sentiment_score REAL
+    )""",
+    "CREATE INDEX IF NOT EXISTS segments_transcript ON segments (transcript_id, start_ms)",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS segments_fts USING fts5(
+        text, content='segments', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS segments_ai AFTER INSERT ON segments BEGIN
+        INSERT INTO segments_fts (rowid, text) VALUES (new.id, new.text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS segments_ad AFTER DELETE ON segments BEGIN
+        INSERT INTO segments_fts (segments_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    END""",
+]
+
+_SELECT_TRANSCRIPT_ID = "SELECT id FROM transcripts WHERE audio_hash = ?"
+_INSERT_TRANSCRIPT = (
+    "INSERT INTO transcripts (audio_hash, source, duration, text, sentiment_label, sentiment_score, created_at) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+_UPDATE_TRANSCRIPT = (
+    "UPDATE transcripts SET source = ?, duration = ?, text = ?, sentiment_label = ?, sentiment_score = ?, "
+    "created_at = ? WHERE id = ?"
+)
+_DELETE_SEGMENTS = "DELETE FROM segments WHERE transcript_id = ?"
+_DELETE_SPEAKERS = "DELETE FROM transcript_speakers WHERE transcript_id = ?"
+_INSERT_SPEAKER = (
+    "INSERT INTO transcript_speakers (transcript_id, speaker, sentiment_label, sentiment_score) VALUES (?, ?, ?, ?)"
+)
+_INSERT_SEGMENT = (
+    "INSERT INTO segments (transcript_id, start_ms, end_ms, speaker, text, sentiment_label, sentiment_score) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+
+# Best matches first (bm25), ranked inside the FTS index before joining back to the
+# tables, so only the returned rows are ever read from segments
+_SEARCH = """
+    SELECT s.id, s.transcript_id, t.source, s.start_ms, s.end_ms, s.speaker, s.text,
+           hits.snippet, hits.rank
+    FROM (
+        SELECT rowid, rank, snippet(segments_fts, 0, '[', ']', '...', 16) AS snippet
+        FROM segments_fts WHERE segments_fts MATCH ? ORDER BY rank LIMIT ?
+    ) AS hits
+    JOIN segments AS s ON s.id = hits.rowid
+    JOIN transcripts AS t ON t.id = s.transcript_id
+    ORDER BY hits.rank
+"""
+
+# With filters the limit has to be applied after them, so the join happens first
+_SEARCH_FILTERED = """
+    SELECT s.id, s.transcript_id, t.source, s.start_ms, s.end_ms, s.speaker, s.text,
+           snippet(segments_fts, 0, '[', ']', '...', 16), segments_fts.rank
+    FROM segments_fts
+    JOIN segments AS s ON s.id = segments_fts.rowid
+    JOIN transcripts AS t ON t.id = s.transcript_id
+    WHERE segments_fts MATCH ? AND (? IS NULL OR s.speaker = ?) AND (? IS NULL OR s.transcript_id = ?)
+    ORDER BY segments_fts.rank LIMIT ?
+"""
+
+
+class InvalidQuery(ValueError):
+    pass
+
+
+def _migrate(conn):
+    for statement in _SCHEMA:
+        conn.execute(statement)
+    conn.commit()
+
+
+def _pool(db_path):
+    return get_pool(db_path, migrate=_migrate)
+
+
+def _ms(seconds):
+    return int(round(seconds * 1000))
+
+
+# Function to store a processed recording, replacing any earlier result for the same
+# audio. result is the pipeline output: transcription, sentiment, speaker_sentiment and
+# the aligned diarization segments. Returns the transcript ID.
+def save_transcript(audio_hash, duration, result, source=None, db_path=TRANSCRIPTS_DB_PATH):
+    sentiment = result.get("sentiment") or {}
+    speakers = result.get("speaker_sentiment") or {}
+    segments = [segment for segment in result["diarization"] if segment["text"] != NO_TEXT]
+    now = time.time()
+
+    with _pool(db_path).transaction() as conn:
+        row = conn.execute(_SELECT_TRANSCRIPT_ID, (audio_hash,)).fetchone()
+        fields = (source, duration, result["transcription"], sentiment.get("label"), sentiment.get("score"), now)
+        if row is None:
+            transcript_id = conn.execute(_INSERT_TRANSCRIPT, (audio_hash,) + fields).lastrowid
+        else:
+            transcript_id = row[0]
+            conn.execute(_UPDATE_TRANSCRIPT, fields + (transcript_id,))
+            conn.execute(_DELETE_SEGMENTS, (transcript_id,))
+            conn.execute(_DELETE_SPEAKERS, (transcript_id,))
+
+        conn.executemany(_INSERT_SPEAKER, [
+            (transcript_id, speaker, score.get("label"), score.get("score"))
+            for speaker, score in speakers.items()
+        ])
+        conn.executemany(_INSERT_SEGMENT, [
+            (
+                transcript_id, _ms(segment["start"]), _ms(segment["end"]), segment.get("speaker"), segment["text"],
+                (segment.get("sentiment") or {}).get("label"), (segment.get("sentiment") or {}).get("score"),
+            )
+            for segment in segments
+        ])
+    return transcript_id
+
+
+# Function to turn user input into an FTS5 query: every word must match, a trailing *
+# matches a prefix, and "quoted phrases" match in order. Operators and column filters
+# are not passed through, so arbitrary input cannot raise a syntax error.
+def build_match(query):
+    terms = []
+    for phrase, word in re.findall(r'"([^"]*)"|(\S+)', query):
+        text = phrase if phrase else word
+        prefix = not phrase and text.endswith("*")
+        tokens = re.findall(r"\w+", text)
+        if not tokens:
+            continue
+        quoted = '"' + " ".join(tokens) + '"'
+        terms.append(quoted + ("*" if prefix else ""))
+    if not terms:
+        raise InvalidQuery("Query has no searchable words")
+    return " ".join(terms)
+
+
+# Function to find segments matching a full-text query. Returns dicts with the
+# transcript ID, source file name, start and end in seconds, speaker, text and a
+# highlighted snippet, best match first.
+def search_segments(query, limit=20, speaker=None, transcript_id=None, db_path=TRANSCRIPTS_DB_PATH):
+    match = build_match(query)
+    limit = max(1, min(limit, MAX_SEARCH_RESULTS))
+    with _pool(db_path).connection() as conn:
+        if speaker is None and transcript_id is None:
+            rows = conn.execute(_SEARCH, (match, limit)).fetchall()
+        else:
+            rows = conn.execute(
+                _SEARCH_FILTERED, (match, speaker, speaker, transcript_id, transcript_id, limit)
+            ).fetchall()
+    return [
+        {
+            "segment_id": segment_id,
+            "transcript_id": found_transcript_id,
+            "source": source,
+            "start": start_ms / 1000,
+            "end": end_ms / 1000,
+            "speaker": found_speaker,
+            "text": text,
+            "snippet": snippet,
+            "score": -rank,
+        }
+        for segment_id, found_transcript_id, source, start_ms, end_ms, found_speaker, text, snippet, rank in rows
+    ]
+
+
+# Function to load one stored transcript with its speakers and segments, or None
+def get_transcript(transcript_id, db_path=TRANSCRIPTS_DB_PATH):
+    with _pool(db_path).connection() as conn:
+        row = conn.execute(
+            "SELECT id, source, duration, text, sentiment_label, sentiment_score, created_at "
+            "FROM transcripts WHERE id = ?", (transcript_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        speakers = conn.execute(
+            "SELECT speaker, sentiment_label, sentiment_score FROM transcript_speakers WHERE transcript_id = ?",
+            (transcript_id,)
+        ).fetchall()
+        segments = conn.execute(
+            "SELECT start_ms, end_ms, speaker, text, sentiment_label, sentiment_score FROM segments "
+            "WHERE transcript_id = ? ORDER BY start_ms", (transcript_id,)
+        ).fetchall()
+    return {
+        "id": row[0],
+        "source": row[1],
+        "duration": row[2],
+        "transcription": row[3],
+        "sentiment": {"label": row[4], "score": row[5]},
+        "created_at": row[6],
+        "speaker_sentiment": {speaker: {"label": label, "score": score} for speaker, label, score in speakers},
+        "segments": [
+            {
+                "start": start_ms / 1000, "end": end_ms / 1000, "speaker": speaker, "text": text,
+                "sentiment": {"label": label, "score": score} if label else None,
+            }
+            for start_ms, end_ms, speaker, text, label, score in segments
+        ],
+    }
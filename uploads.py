@@ -0,0 +1,82 @@
+import os
+import uuid
+
+UPLOAD_FOLDER = './uploads'
+
+# Uploads are copied to disk in chunks of this size, so memory use per upload is bounded
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+
+# Largest accepted upload in bytes; 0 disables the limit
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(2 * 1024 ** 3)))
+
+
+class UploadTooLarge(Exception):
+    def __init__(self, limit):
+        super().__init__(f"Upload exceeds the {limit} byte limit")
+        self.limit = limit
+
+
+# Function to build a unique path inside the upload folder for a client-supplied filename
+def upload_path(filename, folder=UPLOAD_FOLDER):
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, f"{uuid.uuid4().hex}_{os.path.basename(filename or 'upload')}")
+
+
+# Function to recover the client-supplied filename from a path built by upload_path
+def original_filename(file_path):
+    name = os.path.basename(file_path)
+    prefix, _, rest = name.partition("_")
+    if rest and len(prefix) == 32 and all(c in "0123456789abcdef" for c in prefix):
+        return rest
+    return name
+
+
+class _UploadWriter:
+    def __init__(self, file_path, max_bytes):
+        self.file_path = file_path
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._file = open(file_path, "wb")
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.max_bytes and self.size > self.max_bytes:
+            raise UploadTooLarge(self.max_bytes)
+        self._file.write(chunk)
+
+    def close(self, failed):
+        self._file.close()
+        if failed and os.path.exists(self.file_path):
+            os.remove(self.file_path)
+
+
+# Function to copy a file-like stream (e.g. Flask's FileStorage.stream) to disk chunk by chunk
+def save_stream(stream, file_path, max_bytes=MAX_UPLOAD_BYTES, chunk_size=UPLOAD_CHUNK_SIZE):
+    writer = _UploadWriter(file_path, max_bytes)
+    failed = True
+    try:
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            writer.write(chunk)
+        failed = False
+    finally:
+        writer.close(failed)
+    return writer.size
+
+
+# Async variant for FastAPI's UploadFile, whose read() is a coroutine
+async def save_async_stream(stream, file_path, max_bytes=MAX_UPLOAD_BYTES, chunk_size=UPLOAD_CHUNK_SIZE):
+    writer = _UploadWriter(file_path, max_bytes)
+    failed = True
+    try:
+        while True:
+            chunk = await stream.read(chunk_size)
+            if not chunk:
+                break
+            writer.write(chunk)
+        failed = False
+    finally:
+        writer.close(failed)
+    return writer.size
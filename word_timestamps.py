@@ -0,0 +1,180 @@
+import os
+import json
+import torch
+import torch.nn.functional as F
+
+# Also return per-word timings alongside the segments
+WORD_TIMESTAMPS = os.getenv("WORD_TIMESTAMPS", "0") == "1"
+
+# Each encoder frame covers 20 ms: hop of 160 samples at 16 kHz, then a stride-2 conv
+SAMPLES_PER_FRAME = 320
+SECONDS_PER_FRAME = 0.02
+
+
+# Function to read the cross-attention heads known to follow the audio, and the median
+# filter width, that ship with the checkpoint
+def load_alignment_config(model_dir):
+    with open(os.path.join(model_dir, "generation_config.json")) as f:
+        heads = json.load(f).get("alignment_heads", [])
+    with open(os.path.join(model_dir, "config.json")) as f:
+        width = json.load(f).get("median_filter_width", 7)
+    return heads, width
+
+
+# Word timings for a batch of decoded windows. A single teacher-forced decoder pass over
+# the generated tokens (reusing the encoder output from generation) provides the
+# cross-attention; the alignment heads are filtered and averaged, and every window's
+# token/frame path is found by one batched DTW.
+class WordAligner:
+    def __init__(self, model, tokenizer, alignment_heads, median_filter_width=7):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.heads = [tuple(head) for head in alignment_heads]
+        self.median_filter_width = median_filter_width
+        self.special_ids = set(tokenizer.all_special_ids)
+        self.eot = tokenizer.eos_token_id
+        self.timestamp_begin = tokenizer.convert_tokens_to_ids("<|0.00|>")
+        self.decoder_start = model.generation_config.decoder_start_token_id
+
+    # Return, for each window, a list of {"word", "start", "end"} relative to the window
+    def align(self, encoder_outputs, sequences, num_samples):
+        if not self.heads:
+            return [[] for _ in num_samples]
+        if sequences[0, 0] != self.decoder_start:
+            start = torch.full((sequences.shape[0], 1), self.decoder_start, dtype=sequences.dtype)
+            sequences = torch.cat((start, sequences), dim=1)
+
+        with torch.inference_mode():
+            outputs = self.model(
+                encoder_outputs=encoder_outputs, decoder_input_ids=sequences, output_attentions=True
+            )
+        if not outputs.cross_attentions or outputs.cross_attentions[0] is None:
+            raise RuntimeError(
+                "The model returned no cross-attention weights; load it with attn_implementation=\"eager\""
+            )
+        # (batch, heads, tokens, frames)
+        weights = torch.stack([outputs.cross_attentions[layer][:, head] for layer, head in self.heads], dim=1)
+
+        rows, tokens = self._select_rows(sequences)
+        frames = [max(1, min(weights.shape[-1], n // SAMPLES_PER_FRAME)) for n in num_samples]
+        n_rows = max(1, max(len(r) for r in rows))
+        n_frames = max(frames)
+
+        # Gather each window's rows into one padded (batch, heads, rows, frames) tensor
+        matrix = torch.zeros((len(rows), weights.shape[1], n_rows, n_frames))
+        for b, row_index in enumerate(rows):
+            if row_index:
+                matrix[b, :, :len(row_index), :frames[b]] = weights[b][:, row_index, :frames[b]]
+
+        matrix = self._normalize(matrix, [len(r) for r in rows], frames)
+        paths = batched_dtw(-matrix.mean(dim=1), [len(r) for r in rows], frames)
+        return [
+            self._words(token_ids, path) if token_ids else []
+            for token_ids, path in zip(tokens, paths)
+        ]
+
+    # For each window, the attention rows that predict its text tokens and the final
+    # end-of-text (row p - 1 predicts token p), plus the text token ids themselves
+    def _select_rows(self, sequences):
+        rows, tokens = [], []
+        for sequence in sequences.tolist():
+            row_index, token_ids = [], []
+            for position in range(1, len(sequence)):
+                token = sequence[position]
+                if token == self.eot:
+                    row_index.append(position - 1)
+                    break
+                if token in self.special_ids or token >= self.timestamp_begin:
+                    continue
+                row_index.append(position - 1)
+                token_ids.append(token)
+            rows.append(row_index if token_ids else [])
+            tokens.append(token_ids)
+        return rows, tokens
+
+    # Standardize each head over the tokens, then median-filter along time
+    def _normalize(self, matrix, n_rows, frames):
+        mask = torch.zeros(matrix.shape[0], 1, matrix.shape[2], matrix.shape[3], dtype=torch.bool)
+        for b, (rows, width) in enumerate(zip(n_rows, frames)):
+            mask[b, :, :rows, :width] = True
+        count = mask.sum(dim=2, keepdim=True).clamp(min=1)
+        mean = (matrix * mask).sum(dim=2, keepdim=True) / count
+        var = (((matrix - mean) * mask) ** 2).sum(dim=2, keepdim=True) / count
+        matrix = ((matrix - mean) / (var.sqrt() + 1e-6)) * mask
+
+        width = self.median_filter_width
+        if width > 1 and matrix.shape[-1] > width // 2:
+            pad = width // 2
+            padded = F.pad(matrix.flatten(0, 2).unsqueeze(1), (pad, pad), mode="reflect").squeeze(1)
+            matrix = padded.unfold(-1, width, 1).median(dim=-1).values.view(matrix.shape)
+        return matrix * mask
+
+    # Token k starts where the path first reaches row k; a word spans from its first
+    # token's start to the start of the next word (the end-of-text row closes the last)
+    def _words(self, token_ids, path):
+        text_index, time_index = path
+        jumps = torch.ones(len(text_index), dtype=torch.bool)
+        jumps[1:] = text_index[1:] != text_index[:-1]
+        starts = (time_index[jumps].float() * SECONDS_PER_FRAME).tolist()
+
+        pieces = self.tokenizer.convert_ids_to_tokens(token_ids)
+        boundaries = [k for k, piece in enumerate(pieces) if k == 0 or piece.startswith("Ġ")]
+        boundaries.append(len(token_ids))
+        words = []
+        for first, last in zip(boundaries[:-1], boundaries[1:]):
+            word = self.tokenizer.convert_tokens_to_string(pieces[first:last]).strip()
+            if word:
+                words.append({
+                    "word": word,
+                    "start": round(starts[first], 2),
+                    "end": round(starts[min(last, len(starts) - 1)], 2),
+                })
+        return words
+
+
+# Function to run DTW for a whole batch at once. cost is (batch, rows, frames), padded;
+# n_rows and n_frames give each item's real size. The recurrence is evaluated one
+# anti-diagonal at a time, so each step is a single vectorized operation over every
+# cell on that diagonal in every item. Returns (row indices, frame indices) per item.
+def batched_dtw(cost, n_rows, n_frames):
+    batch, rows, frames = cost.shape
+    total = torch.full((batch, rows + 1, frames + 1), float("inf"))
+    total[:, 0, 0] = 0
+    trace = torch.zeros((batch, rows + 1, frames + 1), dtype=torch.int8)
+    trace[:, 0, :] = 2
+    trace[:, :, 0] = 1
+
+    for diagonal in range(2, rows + frames + 1):
+        i = torch.arange(max(1, diagonal - frames), min(rows, diagonal - 1) + 1)
+        if not len(i):
+            continue
+        j = diagonal - i
+        candidates = torch.stack((total[:, i - 1, j - 1], total[:, i - 1, j], total[:, i, j - 1]), dim=-1)
+        best, choice = candidates.min(dim=-1)
+        total[:, i, j] = cost[:, i - 1, j - 1] + best
+        trace[:, i, j] = choice.to(torch.int8)
+
+    # Walk every item back from its own end cell in lockstep
+    i = torch.tensor(n_rows)
+    j = torch.tensor(n_frames)
+    index = torch.arange(batch)
+    steps = []
+    while True:
+        active = (i > 0) | (j > 0)
+        if not active.any():
+            break
+        steps.append((i - 1, j - 1, active & (i > 0) & (j > 0)))
+        move = trace[index, i, j].long()
+        diagonal_or_up = active & (move != 2)
+        diagonal_or_left = active & (move != 1)
+        i = i - diagonal_or_up.long()
+        j = j - diagonal_or_left.long()
+
+    paths = []
+    for b in range(batch):
+        cells = [(row[b].item(), col[b].item()) for row, col, valid in reversed(steps) if valid[b]]
+        paths.append((
+            torch.tensor([cell[0] for cell in cells], dtype=torch.long),
+            torch.tensor([cell[1] for cell in cells], dtype=torch.long),
+        ))
+    return paths